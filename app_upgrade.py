@@ -1,209 +1,2863 @@
-
 #!/usr/bin/env python3
 """
 GitHub Streak Dashboard — EXACT (Matches GitHub)
 """
 
+import atexit
+import codecs
+import functools
+import gzip
+import hashlib
+import importlib
+import importlib.util
+import json
 import os
-import requests
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime, timedelta, date, timezone
-from flask import Flask, render_template_string
-from dotenv import load_dotenv
 
-load_dotenv()
+# ---------------- DEFERRED LOADING ---------------- #
+# Importing this module only compiles it: settings, heavy imports (flask,
+# requests, numpy, asyncio) and the shared singletons are built on first use,
+# so tools that only want calculate_stats() start in milliseconds and need no
+# credentials.
 
-# ---------------- CONFIG ---------------- #
+_UNBUILT = object()
+
+
+class _Deferred:
+    """Stand-in for an object built by build() the first time it's used.
+
+    Attribute access, assignment, calls, indexing and iteration go to the
+    real object. With cache_attributes (modules), looked-up attributes are
+    kept on the proxy so later lookups skip the forwarding.
+    """
+
+    def __init__(self, build, cache_attributes=False):
+        object.__setattr__(self, "_build", build)
+        object.__setattr__(self, "_value", _UNBUILT)
+        object.__setattr__(self, "_cache_attributes", cache_attributes)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        value = self._value
+        if value is _UNBUILT:
+            with self._lock:
+                value = self._value
+                if value is _UNBUILT:
+                    value = self._build()
+                    object.__setattr__(self, "_value", value)
+        return value
+
+    def __getattr__(self, name):
+        value = getattr(self._get(), name)
+        if self._cache_attributes:
+            object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._get()(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __iter__(self):
+        return iter(self._get())
 
-GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
-TOKEN = os.getenv("GITHUB_TOKEN")
+    def __len__(self):
+        return len(self._get())
 
-if not GITHUB_USERNAME or not TOKEN:
-    raise RuntimeError("GITHUB_USERNAME or GITHUB_TOKEN missing")
+    def __bool__(self):
+        return bool(self._get())
 
+
+def deferred(build):
+    return _Deferred(build)
+
+
+def deferred_import(name, optional=False):
+    # optional modules that aren't installed come back as None right away
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return _Deferred(lambda: importlib.import_module(name), cache_attributes=True)
+
+
+asyncio = deferred_import("asyncio")
+futures = deferred_import("concurrent.futures")
+flask = deferred_import("flask")
+requests = deferred_import("requests")
+# optional: streak analytics fall back to pure Python
+np = deferred_import("numpy", optional=True)
+# optional: pages are then pre-compressed with gzip only
+brotli = deferred_import("brotli", optional=True)
+# optional: the JSON API falls back to the json module
+orjson = deferred_import("orjson", optional=True)
+# optional: calendar responses are then streamed through json_events()
+ijson = deferred_import("ijson", optional=True)
+
+# ---------------- CONFIG ---------------- #
+
+API_URL = "https://api.github.com"
 GRAPHQL_URL = "https://api.github.com/graphql"
+FIRST_YEAR = 2008
+
+
+def _read_settings():
+    GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
+    TOKEN = os.getenv("GITHUB_TOKEN")
+    # extra tokens (comma-separated) that other users' and team fetches are spread
+    # over; calls about GITHUB_USERNAME itself always use GITHUB_TOKEN
+    TOKENS = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]
+    TOKEN = TOKEN or (TOKENS[0] if TOKENS else None)
+    HEADERS = {
+        "Authorization": f"Bearer {TOKEN}",
+        "Accept": "application/vnd.github+json"
+    }
+    # number of year windows fetched in parallel (1 = serial)
+    FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "6"))
+    # extra attempts per GitHub call on network / 5xx errors, with full-jitter
+    # exponential backoff starting at RETRY_BASE_DELAY, capped at RETRY_MAX_DELAY
+    FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+    # retries allowed per successful call, plus a burst, across all endpoints
+    RETRY_RATIO = float(os.getenv("RETRY_RATIO", "0.2"))
+    RETRY_BURST = int(os.getenv("RETRY_BURST", "10"))
+    # consecutive failures that open an endpoint's circuit, and seconds it stays
+    # open before calls are let through again
+    CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+    CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))
+    # keep-alive pool: distinct hosts kept, and connections kept per host
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+    # ETag / Last-Modified cache for REST GETs: body budget, and optional file to
+    # keep it across restarts ("" = memory only)
+    HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    HTTP_CACHE_FILE = os.getenv("HTTP_CACHE_FILE", "")
+    # "batched" = one aliased query for all years, "concurrent" = one query per year
+    FETCH_MODE = os.getenv("FETCH_MODE", "batched")
+    # seconds a batch size learned from a GraphQL complexity error is kept
+    BATCH_LIMIT_TTL = float(os.getenv("BATCH_LIMIT_TTL", "3600"))
+    # sqlite file holding the contribution calendar ("" disables the store)
+    CALENDAR_DB = os.getenv("CALENDAR_DB", "contributions.db")
+    # serve straight from the store if it was synced less than this many seconds ago
+    STORE_SYNC_INTERVAL = int(os.getenv("STORE_SYNC_INTERVAL", "300"))
+    # seconds between background dashboard refreshes
+    REFRESH_INTERVAL = int(os.getenv("REFRESH_INTERVAL", "60"))
+    # "0" turns the refresher thread off (snapshots are then rebuilt on demand)
+    BACKGROUND_REFRESH = os.getenv("BACKGROUND_REFRESH", "1") != "0"
+    # rendered pages kept (one per snapshot + day + variant), and API bodies /
+    # heatmap images kept apart from them (one per snapshot + query)
+    PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "16"))
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "64"))
+    # "flask" = threaded Flask dev server, "asgi" = asgi_app under uvicorn
+    SERVE_MODE = os.getenv("SERVE_MODE", "flask")
+    # threads serving the Flask-only paths (heatmaps, /u/<login>, /team) in ASGI mode
+    ASGI_FLASK_WORKERS = int(os.getenv("ASGI_FLASK_WORKERS", "16"))
+    # heatmap colour levels: "fixed" (1/3/6/10 like before), "quartile" (GitHub
+    # style, from the window's non-zero days) or explicit lower bounds "1,3,6,10"
+    HEATMAP_THRESHOLDS = os.getenv("HEATMAP_THRESHOLDS", "fixed")
+    # parallel per-repo commit requests (1 = serial)
+    COMMIT_WORKERS = int(os.getenv("COMMIT_WORKERS", "8"))
+    # per-repo request timeout, and the cap for the whole fan-out, in seconds
+    COMMIT_TIMEOUT = float(os.getenv("COMMIT_TIMEOUT", "10"))
+    COMMIT_BATCH_TIMEOUT = float(os.getenv("COMMIT_BATCH_TIMEOUT", "20"))
+    # "rest" = repo list + one commits call per repo, "graphql" = a single query
+    COMMITS_BACKEND = os.getenv("COMMITS_BACKEND", "rest")
+    # seconds the today/yesterday tables are reused, and how long a repo whose
+    # commits request failed is skipped
+    COMMIT_CACHE_TTL = float(os.getenv("COMMIT_CACHE_TTL", "60"))
+    REPO_NEGATIVE_TTL = float(os.getenv("REPO_NEGATIVE_TTL", "300"))
+    # /u/<login> dashboards: snapshots kept (least recently viewed evicted first),
+    # seconds before a viewed user is refreshed again, how long after the last
+    # view they keep being refreshed, and how long a failed first load is remembered
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "256"))
+    USER_REFRESH_INTERVAL = int(os.getenv("USER_REFRESH_INTERVAL", "600"))
+    USER_ACTIVE_WINDOW = int(os.getenv("USER_ACTIVE_WINDOW", "3600"))
+    USER_NEGATIVE_TTL = float(os.getenv("USER_NEGATIVE_TTL", "60"))
+    # shared user fetch scheduler: parallel refreshes, and the cap on refreshes
+    # started per minute across all users
+    USER_FETCH_WORKERS = int(os.getenv("USER_FETCH_WORKERS", "4"))
+    USER_REFRESHES_PER_MINUTE = int(os.getenv("USER_REFRESHES_PER_MINUTE", "30"))
+    # /team leaderboard: comma-separated logins, seconds between refreshes, and
+    # the most year windows (over all members) put in one aliased query
+    TEAM_LOGINS = [login.strip() for login in os.getenv("TEAM_LOGINS", "").split(",") if login.strip()]
+    TEAM_REFRESH_INTERVAL = int(os.getenv("TEAM_REFRESH_INTERVAL", "600"))
+    TEAM_BATCH_WINDOWS = int(os.getenv("TEAM_BATCH_WINDOWS", "60"))
+    # share of each rate-limit window kept for high-priority calls; below it the
+    # commit tables and background user refreshes are deferred
+    RATE_RESERVE = float(os.getenv("RATE_RESERVE", "0.1"))
+    # seconds a token that got a 401 is left out of the pool; GITHUB_TOKEN itself
+    # is tried again sooner, after PRIMARY_TOKEN_QUARANTINE seconds doubling with
+    # each 401 in a row, up to TOKEN_QUARANTINE
+    TOKEN_QUARANTINE = float(os.getenv("TOKEN_QUARANTINE", "3600"))
+    PRIMARY_TOKEN_QUARANTINE = float(os.getenv("PRIMARY_TOKEN_QUARANTINE", "60"))
+    return {name: value for name, value in locals().items() if name.isupper()}
+
+
+class Config:
+    """Settings from the environment, read (and .env loaded) on first use.
+
+    Assigning an attribute overrides the setting. GITHUB_USERNAME, TOKEN
+    and HEADERS raise RuntimeError when the credentials are missing.
+    """
+
+    def __init__(self):
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            settings = _read_settings()
+            if not settings["GITHUB_USERNAME"] or not settings["TOKEN"]:
+                for name in ("GITHUB_USERNAME", "TOKEN", "HEADERS"):
+                    del settings[name]
+            for name, value in settings.items():
+                self.__dict__.setdefault(name, value)
+            self._loaded = True
+
+    def __getattr__(self, name):
+        # only called for settings not read yet (or missing credentials)
+        if name.startswith("_") or self._loaded:
+            if name in ("GITHUB_USERNAME", "TOKEN", "HEADERS"):
+                raise RuntimeError("GITHUB_USERNAME or GITHUB_TOKEN missing")
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+
+config = Config()
 
-HEADERS = {
-    "Authorization": f"Bearer {TOKEN}",
-    "Accept": "application/vnd.github+json"
-}
 
 # ---------------- HELPERS ---------------- #
 
 def fmt(d):
     return d.strftime("%d %b %Y") if d else ""
 
-# ---------------- FETCH CONTRIBUTIONS ---------------- #
 
-def fetch_contributions():
-    query = """
-    query($login: String!, $from: DateTime!, $to: DateTime!) {
-      user(login: $login) {
-        contributionsCollection(from: $from, to: $to) {
-          contributionCalendar {
-            totalContributions
-            weeks {
-              contributionDays {
-                date
-                contributionCount
-              }
+LOGIN_RE = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})")
+
+
+def is_own_login(login):
+    # None means the configured GITHUB_USERNAME; logins are case-insensitive
+    return login is None or login.lower() == config.GITHUB_USERNAME.lower()
+
+# ---------------- HTTP CLIENT ---------------- #
+
+_http_counters = {"requests": 0, "connections": 0}
+_http_counters_lock = threading.Lock()
+
+
+def _count(key):
+    with _http_counters_lock:
+        _http_counters[key] += 1
+
+
+def _pooled_adapter(**kwargs):
+    # an HTTPAdapter whose connection pools count new connections (built here
+    # so requests / urllib3 are only imported with the first session)
+    from requests.adapters import HTTPAdapter
+    from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _CountingHTTPConnectionPool(HTTPConnectionPool):
+        def _new_conn(self):
+            _count("connections")
+            return super()._new_conn()
+
+    class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        def _new_conn(self):
+            _count("connections")
+            return super()._new_conn()
+
+    class _PooledAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPConnectionPool,
+                "https": _CountingHTTPSConnectionPool,
             }
+
+    return _PooledAdapter(**kwargs)
+
+
+_http = {"session": None}
+_http_lock = threading.Lock()
+
+
+def http_session():
+    # one keep-alive session shared by every GitHub call (requests.Session is
+    # safe to share for plain get/post across threads)
+    with _http_lock:
+        if _http["session"] is None:
+            session = requests.Session()
+            adapter = _pooled_adapter(pool_connections=config.HTTP_POOL_CONNECTIONS,
+                                      pool_maxsize=config.HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(config.HEADERS)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            session.hooks["response"].append(lambda r, *args, **kwargs: _count("requests"))
+            session.hooks["response"].append(_observe_rate_limit)
+            _http["session"] = session
+        return _http["session"]
+
+
+def http_stats():
+    with _http_counters_lock:
+        stats = dict(_http_counters)
+    stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+    return stats
+
+# ---------------- RATE LIMITS ---------------- #
+
+class RateLimited(Exception):
+    def __init__(self, resource, retry_after):
+        super().__init__(f"{resource} rate limit, retry in {retry_after:.0f}s")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+def token_id(token):
+    # budgets are keyed by a fingerprint, never by the token itself
+    return hashlib.sha256(token.encode()).hexdigest()[:8]
+
+
+class RateBudget:
+    """GitHub rate-limit state per token and resource ("core" = REST,
+    "graphql"), learned from the X-RateLimit-* headers of every response.
+
+    Callers price a call before making it. Low-priority work is refused
+    once the remaining budget dips into the reserve; anything is refused
+    when it can't be paid for, or while GitHub has told us to back off
+    (403/429 with Retry-After or an exhausted limit). Refusals raise
+    RateLimited instead of spending a request on a guaranteed 403.
+    """
+
+    def __init__(self, reserve=None, clock=time.time):
+        self.reserve = config.RATE_RESERVE if reserve is None else reserve
+        self.clock = clock
+        self.state = {}  # (token, resource) -> limit, remaining, reset, blocked_until
+        self.costs = {}  # query kind -> observed GraphQL cost (moving average)
+        self.stats = {"spent": 0, "denied": 0, "deferred": 0, "throttled": 0}
+        self.lock = threading.Lock()
+
+    def _entry(self, token, resource):
+        # caller holds the lock
+        st = self.state.get((token, resource))
+        if st is None:
+            st = self.state[(token, resource)] = {
+                "limit": None, "remaining": None, "reset": 0, "blocked_until": 0}
+        if st["limit"] is not None and st["reset"] and self.clock() >= st["reset"]:
+            st["remaining"] = st["limit"]  # the window rolled over
+        return st
+
+    def _wait(self, st, cost, low_priority, now):
+        # seconds until the call is affordable, or None if it is now
+        if st["blocked_until"] > now:
+            return st["blocked_until"] - now
+        if st["remaining"] is None:
+            return None  # nothing learned yet
+        floor = self.reserve * st["limit"] if low_priority else 0
+        if st["remaining"] - cost < floor:
+            return max(st["reset"] - now, 1)
+        return None
+
+    def allows(self, resource, cost=1, low_priority=False, token=None):
+        with self.lock:
+            st = self._entry(token or token_id(config.TOKEN), resource)
+            return self._wait(st, cost, low_priority, self.clock()) is None
+
+    def acquire(self, resource, cost=1, low_priority=False, token=None):
+        with self.lock:
+            st = self._entry(token or token_id(config.TOKEN), resource)
+            wait = self._wait(st, cost, low_priority, self.clock())
+            if wait is not None:
+                self.stats["deferred" if low_priority else "denied"] += 1
+                raise RateLimited(resource, wait)
+            if st["remaining"] is not None:
+                st["remaining"] -= cost  # until the response headers say otherwise
+            self.stats["spent"] += cost
+
+    def observe(self, status, headers, token):
+        # -> seconds to back off if this response was a rate-limit refusal
+        resource = headers.get("X-RateLimit-Resource", "core")
+        now = self.clock()
+        with self.lock:
+            st = self._entry(token, resource)
+            if "X-RateLimit-Remaining" in headers:
+                st["limit"] = int(headers.get("X-RateLimit-Limit", 0)) or st["limit"]
+                st["remaining"] = int(headers["X-RateLimit-Remaining"])
+                st["reset"] = int(headers.get("X-RateLimit-Reset", 0))
+            if status in (403, 429) and ("Retry-After" in headers or st["remaining"] == 0):
+                wait = float(headers["Retry-After"]) if "Retry-After" in headers else max(st["reset"] - now, 1)
+                st["blocked_until"] = max(st["blocked_until"], now + wait)
+                self.stats["throttled"] += 1
+                return wait
+        return None
+
+    def remaining(self, resource, token):
+        # last known remaining budget, None until a response has said
+        with self.lock:
+            return self._entry(token, resource)["remaining"]
+
+    def note_cost(self, kind, rate_limit):
+        # rate_limit: the { cost remaining } object a GraphQL query asked for
+        if not rate_limit:
+            return
+        with self.lock:
+            old = self.costs.get(kind)
+            cost = rate_limit["cost"]
+            self.costs[kind] = cost if old is None else 0.8 * old + 0.2 * cost
+
+    def price(self, kind, default=1):
+        with self.lock:
+            return max(round(self.costs.get(kind, default)), 1)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def info(self):
+        now = self.clock()
+        with self.lock:
+            budgets = {
+                f"{token}/{resource}": {
+                    "limit": st["limit"], "remaining": st["remaining"],
+                    "reset_in": max(round(st["reset"] - now), 0) if st["reset"] else None,
+                    "blocked_for": max(round(st["blocked_until"] - now, 1), 0),
+                } for (token, resource), st in self.state.items()}
+            return dict(self.stats, reserve=self.reserve, budgets=budgets,
+                        costs={k: round(v, 2) for k, v in self.costs.items()})
+
+
+rate_budget = deferred(RateBudget)
+
+
+class BadToken(Exception):
+    pass
+
+
+class TokenPool:
+    """GitHub tokens that calls are spread over, each with its own budget.
+
+    acquire() picks a token by smooth weighted round-robin, weighted by
+    the token's remaining budget for the resource, so a drained token gets
+    fewer calls long before it is refused. A token answered with a 401 is
+    quarantined for TOKEN_QUARANTINE seconds. primary=True pins the call
+    to GITHUB_TOKEN (viewer queries and the owner's private data); since
+    nothing can stand in for it, its quarantine starts at
+    PRIMARY_TOKEN_QUARANTINE and doubles with each 401 in a row.
+    """
+
+    def __init__(self, tokens, budget, quarantine=None, primary_quarantine=None, clock=time.time):
+        self.tokens = {token_id(t): t for t in dict.fromkeys(tokens)}
+        self.primary = next(iter(self.tokens))
+        self.budget = budget
+        self.quarantine_for = config.TOKEN_QUARANTINE if quarantine is None else quarantine
+        self.primary_quarantine_for = (config.PRIMARY_TOKEN_QUARANTINE if primary_quarantine is None
+                                       else primary_quarantine)
+        self.clock = clock
+        self.current = dict.fromkeys(self.tokens, 0)
+        self.quarantined = {}  # token id -> quarantined until
+        self.primary_strikes = 0  # 401s in a row for the primary token
+        self.picks = dict.fromkeys(self.tokens, 0)
+        self.lock = threading.Lock()
+
+    def _usable(self, primary):
+        # caller holds the lock
+        now = self.clock()
+        ids = [self.primary] if primary else list(self.tokens)
+        return [tid for tid in ids if self.quarantined.get(tid, 0) <= now]
+
+    def _candidates(self, resource, cost, low_priority, primary):
+        usable = self._usable(primary)
+        if not usable:
+            raise BadToken("no usable GitHub token")
+        return usable, [tid for tid in usable
+                        if self.budget.allows(resource, cost, low_priority, token=tid)]
+
+    def _weights(self, resource, ready):
+        # a token nothing is known about yet weighs as much as the fullest known one
+        remaining = {tid: self.budget.remaining(resource, tid) for tid in ready}
+        known = [r for r in remaining.values() if r is not None]
+        full = max(known, default=1)
+        return {tid: max(full if r is None else r, 1) for tid, r in remaining.items()}
+
+    def allows(self, resource, cost=1, low_priority=False, primary=False):
+        with self.lock:
+            try:
+                return bool(self._candidates(resource, cost, low_priority, primary)[1])
+            except BadToken:
+                return False
+
+    def acquire(self, resource, cost=1, low_priority=False, primary=False):
+        # -> request headers for the chosen token; raises RateLimited when no
+        # token can pay for the call (the pool lock is taken before the budget's)
+        with self.lock:
+            usable, ready = self._candidates(resource, cost, low_priority, primary)
+            if ready:
+                weights = self._weights(resource, ready)
+                total = sum(weights.values())
+                for tid, w in weights.items():
+                    # clamped, so credit built up under old weights can't starve the others
+                    self.current[tid] = min(max(self.current[tid] + w, -total), total)
+                tid = max(ready, key=self.current.get)
+                self.current[tid] -= total
+            else:
+                tid = usable[0]  # the budget refuses it, with that token's wait
+            self.budget.acquire(resource, cost, low_priority, token=tid)
+            self.picks[tid] += 1
+            return {"Authorization": f"Bearer {self.tokens[tid]}"}
+
+    def quarantine(self, tid):
+        with self.lock:
+            if tid == self.primary:
+                self.primary_strikes += 1
+                wait = min(self.primary_quarantine_for * 2 ** (self.primary_strikes - 1), self.quarantine_for)
+                self.quarantined[tid] = self.clock() + wait
+            elif tid in self.tokens:
+                self.quarantined[tid] = self.clock() + self.quarantine_for
+
+    def accepted(self, tid):
+        # a response that wasn't a 401: the primary's backoff starts over
+        if tid == self.primary and self.primary_strikes:
+            with self.lock:
+                self.primary_strikes = 0
+
+    def info(self):
+        now = self.clock()
+        with self.lock:
+            return {tid: {"picks": self.picks[tid], "primary": tid == self.primary,
+                          "quarantined_for": max(round(self.quarantined.get(tid, 0) - now), 0)}
+                    for tid in self.tokens}
+
+
+token_pool = deferred(lambda: TokenPool([config.TOKEN] + config.TOKENS, rate_budget))
+
+
+def _response_error(r):
+    # -> the exception a response hook should raise, or None
+    tid = token_id(r.request.headers.get("Authorization", "").split(" ")[-1])
+    if r.status_code == 401:
+        token_pool.quarantine(tid)
+        return BadToken(f"token {tid} was rejected")
+    token_pool.accepted(tid)
+    wait = rate_budget.observe(r.status_code, r.headers, tid)
+    if wait is not None:
+        return RateLimited(r.headers.get("X-RateLimit-Resource", "core"), wait)
+    return None
+
+
+def _observe_rate_limit(r, *args, **kwargs):
+    # response hook: a rate-limit refusal surfaces as RateLimited, a rejected
+    # token as BadToken
+    error = _response_error(r)
+    if error is not None:
+        r.close()
+        raise error
+
+# ---------------- RESILIENCE ---------------- #
+
+class GitHubError(RuntimeError):
+    pass
+
+
+class CircuitOpen(GitHubError):
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"{endpoint} circuit open, retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """Caps retries at `ratio` per successful call, plus a burst of `burst`.
+
+    Every success deposits `ratio` of a retry and every retry withdraws
+    one, so when GitHub fails everything the burst runs out and calls give
+    up after one attempt instead of multiplying the load.
+    """
+
+    def __init__(self, ratio=None, burst=None):
+        self.ratio = config.RETRY_RATIO if ratio is None else ratio
+        self.burst = config.RETRY_BURST if burst is None else burst
+        self.tokens = float(self.burst)
+        self.stats = {"retries": 0, "refused": 0}
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                self.stats["refused"] += 1
+                return False
+            self.tokens -= 1
+            self.stats["retries"] += 1
+            return True
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, tokens=round(self.tokens, 2), ratio=self.ratio, burst=self.burst)
+
+
+class CircuitBreaker:
+    """Fails calls to a struggling endpoint fast instead of waiting on them.
+
+    `failures` consecutive failures open the circuit: calls raise
+    CircuitOpen at once for `reset_after` seconds. After that calls go
+    through again (half-open); the first success closes the circuit, a
+    failure opens it for another `reset_after`.
+    """
+
+    def __init__(self, name, failures=None, reset_after=None, clock=time.monotonic):
+        self.name = name
+        self.failures = config.CIRCUIT_FAILURES if failures is None else failures
+        self.reset_after = config.CIRCUIT_RESET if reset_after is None else reset_after
+        self.clock = clock
+        self.consecutive = 0
+        self.opened_at = None
+        self.stats = {"opened": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            wait = self.opened_at + self.reset_after - self.clock()
+            if wait > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpen(self.name, wait)
+
+    def success(self):
+        with self.lock:
+            self.consecutive = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.consecutive += 1
+            if self.opened_at is not None or self.consecutive >= self.failures:
+                if self.opened_at is None:
+                    self.stats["opened"] += 1
+                self.opened_at = self.clock()
+
+    def info(self):
+        with self.lock:
+            if self.opened_at is None:
+                state = "closed"
+            elif self.clock() < self.opened_at + self.reset_after:
+                state = "open"
+            else:
+                state = "half_open"
+            return dict(self.stats, state=state, consecutive_failures=self.consecutive)
+
+
+retry_budget = deferred(RetryBudget)
+# "repos" = repo lists, "commits" = per-repo commit lists
+breakers = deferred(lambda: {name: CircuitBreaker(name) for name in ("graphql", "repos", "commits")})
+
+
+def retry_delay(attempt):
+    # full jitter: anywhere below the exponential step, so retries spread out
+    return random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _call_outcome(endpoint, r, split_statuses):
+    # -> None if the response goes back to the caller, else the error it counts as
+    if r.status_code in split_statuses:
+        return None  # neither a success nor a failure: the caller asks for less
+    breaker = breakers[endpoint]
+    if r.status_code < 500:
+        breaker.success()
+        retry_budget.deposit()
+        return None
+    breaker.failure()
+    return GitHubError(f"{endpoint}: HTTP {r.status_code}")
+
+
+def _send_rekeyed(send):
+    # a 401 has quarantined the token send() drew, so once more picks another
+    # pool token; a call pinned to the primary gets BadToken from acquire()
+    try:
+        return send()
+    except BadToken:
+        return send()
+
+
+def call_github(endpoint, send, retries=None, split_statuses=()):
+    """send() -> response, retried on network errors and 5xx.
+
+    Retries back off with jitter and draw on the shared retry budget; each
+    outcome feeds the endpoint's circuit breaker. A call whose token gets
+    a 401 is sent once more on another token. split_statuses are handed
+    back without counting either way: for a batched query they mean "ask
+    for less", and if GitHub is down the smaller queries fail for real.
+    """
+    retries = config.FETCH_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        breakers[endpoint].check()
+        try:
+            r = _send_rekeyed(send)
+        except requests.RequestException as e:
+            breakers[endpoint].failure()
+            error = e
+        else:
+            error = _call_outcome(endpoint, r, split_statuses)
+            if error is None:
+                return r
+            r.close()  # a streamed body nobody will read
+        if attempt == retries or not retry_budget.withdraw():
+            raise error
+        time.sleep(retry_delay(attempt))
+
+
+def fallback_errors():
+    # what a GitHub fetch can fail with that stored or last good data covers;
+    # built on use so importing this module doesn't import requests
+    return (requests.RequestException, GitHubError, RateLimited, BadToken)
+
+
+# fetches answered from stored / last good data because GitHub failed
+_fallbacks = {"contributions": 0, "commits": 0}
+_fallbacks_lock = threading.Lock()
+
+
+def count_fallback(source):
+    with _fallbacks_lock:
+        _fallbacks[source] += 1
+
+
+def fallback_stats():
+    with _fallbacks_lock:
+        return dict(_fallbacks)
+
+
+def response_json(r):
+    # check the status first: an error page is a GitHubError, not a decode
+    # error or a KeyError further down
+    if r.status_code != 200:
+        raise GitHubError(f"HTTP {r.status_code}")
+    try:
+        return r.json()
+    except ValueError as e:
+        raise GitHubError(f"invalid JSON: {e}") from e
+
+# ---------------- TTL CACHE ---------------- #
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-key TTL.
+
+    Expiry uses a monotonic clock, so wall-clock jumps can't keep stale
+    data alive. Negative entries remember a failure (the exception) so the
+    same call isn't retried until they expire.
+    """
+
+    def __init__(self, maxsize=256, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "evictions": 0, "expirations": 0}
+
+    def _lookup(self, key):
+        # -> (value, is_negative) or None; caller holds the lock
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        value, expires, negative = entry
+        if self.clock() >= expires:
+            del self.entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["negative_hits" if negative else "hits"] += 1
+        return value, negative
+
+    def peek(self, key):
+        # (value, is_negative) or None
+        with self.lock:
+            return self._lookup(key)
+
+    def get(self, key, default=None):
+        with self.lock:
+            found = self._lookup(key)
+        if found is None or found[1]:
+            return default
+        return found[0]
+
+    def set(self, key, value, ttl=None, negative=False):
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, self.clock() + ttl, negative)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def set_negative(self, key, error, ttl=None):
+        self.set(key, error, ttl, negative=True)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, size=len(self.entries), maxsize=self.maxsize)
+
+
+def cached(cache, ttl=None, negative_ttl=None, key=None, errors=Exception):
+    """Cache a function's results in a TTLCache.
+
+    ttl=0 caches nothing on success (useful with negative_ttl alone);
+    negative_ttl caches raised exceptions of the `errors` types, which are
+    re-raised on a hit. Either TTL may be a callable, read on each call.
+    key(*args, **kwargs) builds the cache key; by default it's the function
+    name plus the arguments.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (fn.__name__, args, tuple(sorted(kwargs.items())))
+            found = cache.peek(k)
+            if found is not None:
+                value, negative = found
+                if negative:
+                    raise value
+                return value
+
+            try:
+                value = fn(*args, **kwargs)
+            except errors as e:
+                neg = negative_ttl() if callable(negative_ttl) else negative_ttl
+                if neg:
+                    cache.set_negative(k, e, neg)
+                raise
+            if ttl != 0:
+                cache.set(k, value, ttl() if callable(ttl) else ttl)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+# ---------------- CONDITIONAL REQUESTS ---------------- #
+
+class CachedResponse:
+    # the bits of requests.Response the fetchers use, rebuilt from the cache
+    def __init__(self, status_code, content, from_cache):
+        self.status_code = status_code
+        self.content = content
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ConditionalCache:
+    """LRU of REST bodies keyed by URL + params, revalidated with ETags.
+
+    GitHub answers a matching If-None-Match / If-Modified-Since with 304,
+    which doesn't count against the rate limit. Eviction is by total body
+    size, least recently used first.
+    """
+
+    def __init__(self, max_bytes, path=""):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if path:
+            self.load()
+
+    @staticmethod
+    def key(url, params):
+        return url + "?" + "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, last_modified, content):
+        if len(content) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old["content"])
+            self.entries[key] = {"etag": etag, "last_modified": last_modified, "content": content}
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted["content"])
+                self.stats["evictions"] += 1
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.size)
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, e in saved:
+            self.put(key, e["etag"], e["last_modified"], e["content"].encode("utf-8"))
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            saved = [(k, dict(e, content=e["content"].decode("utf-8"))) for k, e in self.entries.items()]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(saved, f)
+        os.replace(tmp, self.path)
+
+
+def _build_http_cache():
+    cache = ConditionalCache(config.HTTP_CACHE_MAX_BYTES, config.HTTP_CACHE_FILE)
+    atexit.register(cache.save)
+    return cache
+
+
+http_cache = deferred(_build_http_cache)
+
+
+def conditional_get(url, params=None, timeout=15, primary=False, endpoint="repos"):
+    key = ConditionalCache.key(url, params)
+    entry = http_cache.get(key)
+
+    validators = {}
+    if entry is not None:
+        if entry["etag"]:
+            validators["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            validators["If-Modified-Since"] = entry["last_modified"]
+
+    def send():
+        headers = dict(token_pool.acquire("core", primary=primary), **validators)
+        return http_session().get(url, params=params, headers=headers, timeout=timeout)
+
+    r = call_github(endpoint, send)
+
+    if r.status_code == 304 and entry is not None:
+        http_cache.count("hits")
+        return CachedResponse(200, entry["content"], from_cache=True)
+
+    http_cache.count("misses")
+    etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    if r.status_code == 200 and (etag or last_modified):
+        http_cache.put(key, etag, last_modified, r.content)
+    return r
+
+
+# ---------------- STREAMING JSON ---------------- #
+# Calendar responses are decoded while they stream in: each
+# contributionCalendar goes straight into a ContributionCalendar, so neither
+# the response body, the weeks / contributionDays lists nor a dict per day
+# is ever held. ijson parses when installed, json_events() otherwise.
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_JSON_TOKEN = re.compile(r'\s*(?:([{}\[\]:,])|"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'
+                         r'|(true|false|null))')
+# a whole contributionDays entry, matched in one go (the bulk of a calendar)
+_JSON_DAY = re.compile(r'\s*\{\s*"date"\s*:\s*"([0-9-]+)"\s*,\s*"contributionCount"\s*:\s*(\d+)\s*\}')
+_JSON_LITERALS = {"true": True, "false": False, "null": None}
+_JSON_NUMBER_ENDS = (",", "]", "}", " ", "\n", "\r", "\t")
+
+
+def json_events(chunks):
+    """ijson.basic_parse()-style (event, value) pairs from chunks of JSON bytes.
+
+    Tokens are matched in the buffered text and the rest is kept for the
+    next chunk; a number waits until the character after it has arrived,
+    as it may continue in the next chunk. A {"date": ..., "contributionCount":
+    ...} object comes out as one ("day", (date, count)) event instead of six.
+    """
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    in_map = []  # one entry per open container: is it an object
+    expect_key = False
+    buf, final = "", False
+    chunks = iter(chunks)
+    while True:
+        pos = 0
+        while True:
+            m = _JSON_DAY.match(buf, pos)
+            if m is not None:
+                pos = m.end()
+                expect_key = False
+                yield "day", (m.group(1), int(m.group(2)))
+                continue
+            m = _JSON_TOKEN.match(buf, pos)
+            if m is None or (m.group(3) is not None and not final
+                             and buf[m.end():m.end() + 1] not in _JSON_NUMBER_ENDS):
+                break
+            pos = m.end()
+            punct, string, number, literal = m.groups()
+            if punct in ("{", "["):
+                in_map.append(punct == "{")
+                expect_key = punct == "{"
+                yield ("start_map" if punct == "{" else "start_array"), None
+            elif punct in ("}", "]"):
+                if not in_map:
+                    raise ValueError("unbalanced JSON")
+                in_map.pop()
+                expect_key = False
+                yield ("end_map" if punct == "}" else "end_array"), None
+            elif punct == ",":
+                expect_key = bool(in_map) and in_map[-1]
+            elif string is not None:
+                if "\\" in string:
+                    string = json.loads(f'"{string}"')
+                yield ("map_key" if expect_key else "string"), string
+                expect_key = False
+            elif number is not None:
+                yield "number", float(number) if "." in number or "e" in number.lower() else int(number)
+            elif literal is not None:
+                yield ("null" if literal == "null" else "boolean"), _JSON_LITERALS[literal]
+        buf = buf[pos:]
+        if final:
+            break
+        chunk = next(chunks, None)
+        final = chunk is None
+        buf += decode(b"" if final else chunk, final)
+    if buf.strip() or in_map:
+        raise ValueError("truncated JSON")
+
+
+def _put(container, key, value):
+    if isinstance(container, list):
+        container.append(value)
+    else:
+        container[key] = value
+
+
+def build_calendar_tree(events):
+    """The JSON document from (event, value) pairs, except that every
+    contributionCalendar object becomes {"totalContributions": n,
+    "calendar": ContributionCalendar}, filled day by day as events arrive.
+    json_events()' "day" events are taken as the object they stand for.
+    """
+    root = {}
+    stack, keys = [root], ["document"]
+    cal = None  # the calendar being filled, and how deep inside it we are
+    for event, value in events:
+        if cal is not None:
+            if event == "day":
+                cal["calendar"].append(date.fromisoformat(value[0]), value[1])
+            elif event == "map_key":
+                key = value
+            elif event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+                if day_date is not None and day_count is not None:
+                    cal["calendar"].append(date.fromisoformat(day_date), day_count)
+                    day_date = day_count = None
+                if depth == 0:
+                    cal = None
+            elif key == "date":
+                day_date = value
+            elif key == "contributionCount":
+                day_count = value
+            elif key == "totalContributions" and depth == 1:
+                cal["totalContributions"] = value
+        elif event == "map_key":
+            keys[-1] = value
+        elif event == "start_map" and keys[-1] == "contributionCalendar":
+            cal = {"totalContributions": 0, "calendar": ContributionCalendar()}
+            _put(stack[-1], keys[-1], cal)
+            depth, key, day_date, day_count = 1, None, None, None
+        elif event in ("start_map", "start_array"):
+            container = {} if event == "start_map" else []
+            _put(stack[-1], keys[-1], container)
+            stack.append(container)
+            keys.append(None)
+        elif event in ("end_map", "end_array"):
+            stack.pop()
+            keys.pop()
+        elif event == "day":
+            _put(stack[-1], keys[-1], {"date": value[0], "contributionCount": value[1]})
+        else:
+            _put(stack[-1], keys[-1], value)
+    return root["document"]
+
+
+class _ChunkReader:
+    # the file-like read() ijson wants, over an iterator of byte chunks
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def read(self, size=-1):
+        if size == 0:  # ijson probes with read(0) for bytes vs str
+            return b""
+        return next((chunk for chunk in self.chunks if chunk), b"")
+
+
+def read_calendar_json(r):
+    """response_json() for a GraphQL calendar response sent with stream=True.
+
+    The body is parsed chunk by chunk; contributionCalendar objects come
+    back in the compact form of build_calendar_tree().
+    """
+    if r.status_code != 200:
+        raise GitHubError(f"HTTP {r.status_code}")
+    chunks = r.iter_content(STREAM_CHUNK_SIZE)
+    events = ijson.basic_parse(_ChunkReader(chunks)) if ijson is not None else json_events(chunks)
+    errors = (ValueError,) if ijson is None else (ValueError, ijson.JSONError)
+    try:
+        return build_calendar_tree(events)
+    except errors as e:
+        raise GitHubError(f"invalid JSON: {e}") from e
+
+
+def compact_calendar(cal):
+    # a contributionCalendar decoded in one go (r.json()) -> the streamed form
+    if "calendar" in cal:
+        return cal
+    days = [d for w in cal["weeks"] for d in w["contributionDays"]]
+    return {"totalContributions": cal["totalContributions"], "calendar": ContributionCalendar.from_days(days)}
+
+
+# ---------------- FETCH CONTRIBUTIONS ---------------- #
+
+CONTRIBUTIONS_QUERY = """
+query($login: String!, $from: DateTime!, $to: DateTime!) {
+  user(login: $login) {
+    contributionsCollection(from: $from, to: $to) {
+      contributionCalendar {
+        totalContributions
+        weeks {
+          contributionDays {
+            date
+            contributionCount
           }
         }
       }
     }
-    """
+  }
+}
+"""
 
-    all_days = []
-    total_contributions = 0
-    now = datetime.now(timezone.utc)
 
-    for year in range(2008, now.year + 1):
+def year_windows(now=None, first_year=FIRST_YEAR):
+    # one (from, to) window per calendar year, oldest first
+    now = now or datetime.now(timezone.utc)
+    windows = []
+    for year in range(first_year, now.year + 1):
         start = datetime(year, 1, 1, tzinfo=timezone.utc)
         end = min(datetime(year, 12, 31, 23, 59, 59, tzinfo=timezone.utc), now)
+        windows.append((start, end))
+    return windows
 
-        r = requests.post(
+
+def _fetch_window(start, end, retries=None, login=None):
+    def send():
+        return http_session().post(
             GRAPHQL_URL,
-            headers=HEADERS,
-            json={"query": query, "variables": {
-                "login": GITHUB_USERNAME,
+            headers=token_pool.acquire("graphql", primary=is_own_login(login)),
+            json={"query": CONTRIBUTIONS_QUERY, "variables": {
+                "login": login or config.GITHUB_USERNAME,
                 "from": start.isoformat(),
                 "to": end.isoformat()
             }},
-            timeout=15
+            timeout=15,
+            stream=True
+        )
+
+    with call_github("graphql", send, retries) as r:
+        return _parse_window(read_calendar_json(r))
+
+
+def _parse_window(data):
+    if "errors" in data:
+        raise GitHubError(data["errors"])
+    return compact_calendar(data["data"]["user"]["contributionsCollection"]["contributionCalendar"])
+
+
+CALENDAR_FIELDS = """
+      contributionCalendar {
+        totalContributions
+        weeks {
+          contributionDays {
+            date
+            contributionCount
+          }
+        }
+      }
+"""
+
+# GraphQL error types / messages that mean "ask for less at once"
+_SPLITTABLE_ERRORS = ("MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED", "complexity", "timeout")
+# ... and the ones that say so about the query itself rather than the moment
+_COMPLEXITY_ERRORS = ("MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED")
+
+
+class QueryTooLarge(Exception):
+    def __init__(self, reason, complexity=False):
+        super().__init__(reason)
+        self.complexity = complexity
+
+
+class BatchLimit:
+    """Largest batch to send at once, learned from complexity errors.
+
+    A complexity error for a batch caps later batches at half its size for
+    `ttl` seconds, after which full batches are tried again. Gateway errors
+    and timeouts still split the query at hand, but aren't remembered: one
+    blip shouldn't shrink every load after it.
+    """
+
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = config.BATCH_LIMIT_TTL if ttl is None else ttl
+        self.clock = clock
+        self.max = None
+        self.expires = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.max is not None and self.clock() >= self.expires:
+                self.max = None
+            return self.max
+
+    def rejected(self, size):
+        with self.lock:
+            mid = (size + 1) // 2
+            if self.max is None or mid < self.max:
+                self.max = mid
+            self.expires = self.clock() + self.ttl
+
+
+def _window_blocks(windows):
+    # one aliased contributionsCollection block per window, e.g. y2019: ...
+    blocks = []
+    for start, end in windows:
+        blocks.append(
+            f'    y{start.year}: contributionsCollection(from: "{start.isoformat()}", to: "{end.isoformat()}") {{'
+            + CALENDAR_FIELDS + "    }"
         )
+    return "\n".join(blocks)
 
-        data = r.json()
-        if "errors" in data:
-            raise RuntimeError(data["errors"])
 
-        cal = data["data"]["user"]["contributionsCollection"]["contributionCalendar"]
-        total_contributions += cal["totalContributions"]
-        for w in cal["weeks"]:
-            all_days.extend(w["contributionDays"])
+RATE_LIMIT_FIELDS = "  rateLimit { cost remaining }\n"
 
-    return total_contributions, all_days
+
+def build_batched_query(windows):
+    return ("query($login: String!) {\n  user(login: $login) {\n" + _window_blocks(windows) + "\n  }\n"
+            + RATE_LIMIT_FIELDS + "}\n")
+
+
+def build_team_query(items):
+    # items: [(login, windows)]; one aliased user per login, e.g. u0: user(login: "octocat") { y2019: ... }
+    users = [f"  u{i}: user(login: {json.dumps(login)}) {{\n" + _window_blocks(windows) + "\n  }"
+             for i, (login, windows) in enumerate(items)]
+    return "query {\n" + "\n".join(users) + "\n" + RATE_LIMIT_FIELDS + "}\n"
+
+
+def _is_splittable(errors):
+    text = repr(errors)
+    return any(marker in text for marker in _SPLITTABLE_ERRORS)
+
+
+def _too_large(errors):
+    return QueryTooLarge(errors, complexity=any(e.get("type") in _COMPLEXITY_ERRORS for e in errors))
+
+
+# gateway errors a too-large aliased query gets instead of a GraphQL error
+_SPLITTABLE_STATUSES = (502, 504)
+
+
+def _post_batched(windows, login=None):
+    def send():
+        return http_session().post(
+            GRAPHQL_URL,
+            headers=token_pool.acquire("graphql", rate_budget.price("batched"), primary=is_own_login(login)),
+            json={"query": build_batched_query(windows), "variables": {"login": login or config.GITHUB_USERNAME}},
+            timeout=30,
+            stream=True
+        )
+
+    with call_github("graphql", send, split_statuses=_SPLITTABLE_STATUSES) as r:
+        return _parse_batched(r.status_code, functools.partial(read_calendar_json, r), windows)
+
+
+def _parse_batched(status_code, read_json, windows):
+    if status_code in _SPLITTABLE_STATUSES:
+        raise QueryTooLarge(f"HTTP {status_code}")
+
+    data = read_json()
+    if "errors" in data:
+        if _is_splittable(data["errors"]):
+            raise _too_large(data["errors"])
+        raise GitHubError(data["errors"])
+
+    rate_budget.note_cost("batched", data["data"].get("rateLimit"))
+    user = data["data"]["user"]
+    return [compact_calendar(user[f"y{start.year}"]["contributionCalendar"]) for start, _ in windows]
+
+
+# shared by the batched, team and async fetches
+batch_limit = deferred(BatchLimit)
+
+
+def _fetch_batched(windows, login=None):
+    limit = batch_limit.get()
+    if limit and len(windows) > limit:
+        return [cal for i in range(0, len(windows), limit)
+                for cal in _fetch_batched(windows[i:i + limit], login)]
+
+    try:
+        return _post_batched(windows, login)
+    except QueryTooLarge as e:
+        if len(windows) == 1:
+            # can't split further, fall back to the plain per-year query
+            return [_fetch_window(*windows[0], login=login)]
+        if e.complexity:
+            batch_limit.rejected(len(windows))
+        mid = (len(windows) + 1) // 2
+        return _fetch_batched(windows[:mid], login) + _fetch_batched(windows[mid:], login)
+
+
+def _group_units(units):
+    # [(login, window)] -> [(login, [window, ...])], keeping the order
+    items = []
+    for login, window in units:
+        if items and items[-1][0] == login:
+            items[-1][1].append(window)
+        else:
+            items.append((login, [window]))
+    return items
+
+
+def _post_team(units):
+    items = _group_units(units)
+
+    def send():
+        return http_session().post(GRAPHQL_URL, headers=token_pool.acquire("graphql", rate_budget.price("team")),
+                                   json={"query": build_team_query(items)}, timeout=30, stream=True)
+
+    with call_github("graphql", send, split_statuses=_SPLITTABLE_STATUSES) as r:
+        return _parse_team(r.status_code, functools.partial(read_calendar_json, r), items)
+
+
+def _parse_team(status_code, read_json, items):
+    if status_code in _SPLITTABLE_STATUSES:
+        raise QueryTooLarge(f"HTTP {status_code}")
+
+    data = read_json()
+    errors = data.get("errors")
+    if errors:
+        if _is_splittable(errors):
+            raise _too_large(errors)
+        # an unknown login is a NOT_FOUND error next to everyone else's data
+        if not data.get("data") or any(e.get("type") != "NOT_FOUND" for e in errors):
+            raise GitHubError(errors)
+
+    rate_budget.note_cost("team", data["data"].get("rateLimit"))
+    calendars = []
+    for i, (_, windows) in enumerate(items):
+        user = data["data"].get(f"u{i}")
+        calendars.extend(compact_calendar(user[f"y{start.year}"]["contributionCalendar"]) if user else None
+                         for start, _ in windows)
+    return calendars
+
+
+def _fetch_team_units(units):
+    # units: [(login, window)] -> one calendar per unit (None for unknown logins)
+    limit = min(config.TEAM_BATCH_WINDOWS, batch_limit.get() or config.TEAM_BATCH_WINDOWS)
+    if len(units) > limit:
+        return [cal for i in range(0, len(units), limit)
+                for cal in _fetch_team_units(units[i:i + limit])]
+
+    try:
+        return _post_team(units)
+    except QueryTooLarge as e:
+        if len(units) == 1:
+            login, window = units[0]
+            return [_fetch_window(*window, login=login)]
+        if e.complexity:
+            batch_limit.rejected(len(units))
+        mid = (len(units) + 1) // 2
+        return _fetch_team_units(units[:mid]) + _fetch_team_units(units[mid:])
+
+
+def fetch_team_calendars(units, workers=None):
+    # chunks of TEAM_BATCH_WINDOWS units, fetched in parallel
+    workers = config.FETCH_WORKERS if workers is None else workers
+    chunks = [units[i:i + config.TEAM_BATCH_WINDOWS] for i in range(0, len(units), max(config.TEAM_BATCH_WINDOWS, 1))]
+    if workers > 1 and len(chunks) > 1:
+        with futures.ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            return [cal for part in pool.map(_fetch_team_units, chunks) for cal in part]
+    return [cal for chunk in chunks for cal in _fetch_team_units(chunk)]
+
+
+def _fetch_calendars(windows, workers=None, mode=None, login=None):
+    workers = config.FETCH_WORKERS if workers is None else workers
+    mode = mode or config.FETCH_MODE
+
+    if mode == "batched":
+        return _fetch_batched(windows, login)
+    if workers > 1 and len(windows) > 1:
+        # map() yields in submission order, so the merge stays oldest-first
+        with futures.ThreadPoolExecutor(max_workers=min(workers, len(windows))) as pool:
+            return list(pool.map(lambda w: _fetch_window(*w, login=login), windows))
+    return [_fetch_window(*w, login=login) for w in windows]
+
+
+def fetch_contributions_remote(workers=None, mode=None, login=None):
+    return _join_calendars(_fetch_calendars(year_windows(), workers, mode, login))
+
+
+def _join_calendars(calendars):
+    # the year calendars laid end to end -> (total, ContributionCalendar)
+    total, joined = 0, ContributionCalendar()
+    for cal in calendars:
+        total += cal["totalContributions"]
+        joined.extend(cal["calendar"])
+    return total, joined
+
+
+# logins already read from the store since this process started
+_store_reads = set()
+_store_reads_lock = threading.Lock()
+
+
+def _first_store_read(login):
+    with _store_reads_lock:
+        first = login.lower() not in _store_reads
+        _store_reads.add(login.lower())
+    return first
+
+
+def _background_sync(store, workers, mode, login):
+    try:
+        sync_contributions(store, workers=workers, mode=mode, login=login)
+    except Exception:
+        pass  # the next refresh syncs (or falls back to the store) again
+
+
+def fetch_contributions(workers=None, mode=None, login=None):
+    # -> (total, ContributionCalendar); login defaults to GITHUB_USERNAME
+    store = get_calendar_store()
+    if store is None:
+        return fetch_contributions_remote(workers, mode, login)
+    login = login or config.GITHUB_USERNAME
+
+    if _first_store_read(login):
+        # cold start: serve what's on disk and sync in the background, so the
+        # first page neither waits on GitHub nor fails with it
+        total, calendar = store.load_calendar(login)
+        if len(calendar):
+            threading.Thread(target=_background_sync, args=(store, workers, mode, login),
+                             name="store-sync", daemon=True).start()
+            return total, calendar
+
+    try:
+        return sync_contributions(store, workers=workers, mode=mode, login=login)
+    except fallback_errors():
+        # out of budget or GitHub unreachable: whatever the store has beats no page at all
+        total, calendar = store.load_calendar(login)
+        if not len(calendar):
+            raise
+        count_fallback("contributions")
+        return total, calendar
+
+
+# ---------------- CALENDAR STORE ---------------- #
+
+class CalendarStore:
+    """SQLite copy of the contribution calendar, one row per (login, date).
+
+    Years that ended before they were fetched are marked closed and never
+    refetched; the open year is kept current with small delta windows.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS days (
+        login TEXT NOT NULL, date TEXT NOT NULL, count INTEGER NOT NULL,
+        PRIMARY KEY (login, date));
+    CREATE TABLE IF NOT EXISTS years (
+        login TEXT NOT NULL, year INTEGER NOT NULL, total INTEGER NOT NULL,
+        closed INTEGER NOT NULL, PRIMARY KEY (login, year));
+    CREATE TABLE IF NOT EXISTS syncs (
+        login TEXT PRIMARY KEY, synced_at TEXT NOT NULL);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+
+    def load_calendar(self, login):
+        # -> (total, ContributionCalendar) for everything stored about login
+        with self.lock:
+            total = self.db.execute(
+                "SELECT COALESCE(SUM(total), 0) FROM years WHERE login = ?", (login,)).fetchone()[0]
+            calendar = ContributionCalendar()
+            for d, c in self.db.execute(
+                    "SELECT date, count FROM days WHERE login = ? ORDER BY date", (login,)):
+                calendar.append(date.fromisoformat(d), c)
+        return total, calendar
+
+    def closed_years(self, login):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT year FROM years WHERE login = ? AND closed = 1", (login,)).fetchall()
+        return {y for (y,) in rows}
+
+    def last_sync(self, login):
+        with self.lock:
+            row = self.db.execute("SELECT synced_at FROM syncs WHERE login = ?", (login,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def save_years(self, login, windows, calendars, now):
+        with self.lock, self.db:
+            for (start, end), cal in zip(windows, calendars):
+                self._put_days(login, cal["calendar"])
+                closed = int(end.year < now.year)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO years VALUES (?, ?, ?, ?)",
+                    (login, start.year, cal["totalContributions"], closed))
+            self._mark_synced(login, now)
+
+    def save_delta(self, login, calendar, now):
+        # only the open year changes here; its total is the sum of its days
+        with self.lock, self.db:
+            self._put_days(login, calendar)
+            year = now.year
+            total = self.db.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM days WHERE login = ? AND date >= ?",
+                (login, f"{year}-01-01")).fetchone()[0]
+            self.db.execute("INSERT OR REPLACE INTO years VALUES (?, ?, ?, 0)", (login, year, total))
+            self._mark_synced(login, now)
+
+    def _put_days(self, login, calendar):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO days VALUES (?, ?, ?)",
+            ((login, d.isoformat(), c) for d, c in calendar.items()))
+
+    def _mark_synced(self, login, now):
+        self.db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?)", (login, now.isoformat()))
+
+
+_store = {"instance": None}
+_store_lock = threading.Lock()
+
+
+def get_calendar_store():
+    if not config.CALENDAR_DB:
+        return None
+    with _store_lock:
+        if _store["instance"] is None:
+            _store["instance"] = CalendarStore(config.CALENDAR_DB)
+        return _store["instance"]
+
+
+def load_contributions(store=None, login=None):
+    # disk only, never touches the network
+    store = store or get_calendar_store()
+    return store.load_calendar(login or config.GITHUB_USERNAME)
+
+
+def _sync_plan(store, login, now):
+    # -> ("fresh", None), ("delta", (since, now)) or ("years", windows)
+    last = store.last_sync(login)
+
+    if last and (now - last).total_seconds() < config.STORE_SYNC_INTERVAL:
+        return "fresh", None
+
+    closed = store.closed_years(login)
+    missing = [w for w in year_windows(now) if w[0].year not in closed]
+
+    if last and last.year == now.year and [w[0].year for w in missing] == [now.year]:
+        # only the open year is left: refetch from the day before the last sync
+        since = datetime.combine(last.date() - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+        return "delta", (since, now)
+    return "years", missing
+
+
+def sync_contributions(store, workers=None, mode=None, now=None, login=None):
+    now = now or datetime.now(timezone.utc)
+    login = login or config.GITHUB_USERNAME
+    plan, arg = _sync_plan(store, login, now)
+
+    if plan == "delta":
+        cal = _fetch_window(*arg, login=login)
+        store.save_delta(login, cal["calendar"], now)
+    elif plan == "years":
+        store.save_years(login, arg, _fetch_calendars(arg, workers, mode, login), now)
+
+    return store.load_calendar(login)
 
 
 # ---------------- DAILY COMMITS ---------------- #
 
-_commit_cache = {"ts": None, "data": None}
+commit_cache = deferred(lambda: TTLCache(maxsize=256, ttl=config.COMMIT_CACHE_TTL))
 
-def fetch_recent_commits():
-    global _commit_cache
 
-    # cache 60 seconds
-    if _commit_cache["ts"] and (datetime.utcnow() - _commit_cache["ts"]).seconds < 60:
-        return _commit_cache["data"]
+class RepoFetchError(Exception):
+    pass
 
-    today = datetime.now(timezone.utc).date()
-    yesterday = today - timedelta(days=1)
+@cached(commit_cache, ttl=0, negative_ttl=lambda: config.REPO_NEGATIVE_TTL, errors=RepoFetchError,
+        key=lambda name, since, until, primary=False: ("repo_failed", name))
+def _get_repo_commits(name, since, until, primary=False):
+    try:
+        cr = conditional_get(
+            f"{API_URL}/repos/{name}/commits",
+            params={"since": since, "until": until, "per_page": 20},
+            timeout=config.COMMIT_TIMEOUT,
+            primary=primary,
+            endpoint="commits"
+        )
+        return response_json(cr)
+    except CircuitOpen:
+        raise  # GitHub's problem, not the repo's
+    except (requests.RequestException, GitHubError) as e:
+        raise RepoFetchError(f"{name}: {e}") from e
+
+
+def _fetch_repo_commits(name, since, until, primary=False):
+    # failed repos are skipped (and remembered for REPO_NEGATIVE_TTL seconds)
+    try:
+        return _get_repo_commits(name, since, until, primary)
+    except (RepoFetchError, CircuitOpen):
+        return []
+
+
+def _fan_out_repo_commits(names, since, until, workers=None, primary=False):
+    # one commit list per repo, in the same order as names
+    workers = config.COMMIT_WORKERS if workers is None else workers
+
+    if workers <= 1 or len(names) <= 1:
+        return [_fetch_repo_commits(n, since, until, primary) for n in names]
+
+    pool = futures.ThreadPoolExecutor(max_workers=min(workers, len(names)))
+    jobs = [pool.submit(_fetch_repo_commits, n, since, until, primary) for n in names]
+    futures.wait(jobs, timeout=config.COMMIT_BATCH_TIMEOUT)
+    # repos still running past the batch deadline are dropped, not waited on
+    pool.shutdown(wait=False, cancel_futures=True)
+    done = {f for f in jobs if f.done() and not f.cancelled()}
+    for f in done:
+        if isinstance(f.exception(), (RateLimited, BadToken)):
+            raise f.exception()  # the scan stopped early: don't pass it off as complete
+    return [f.result() if f in done and f.exception() is None else [] for f in jobs]
+
+
+_RECENT_COMMITS_TEMPLATE = """
+query($since: GitTimestamp!, $until: GitTimestamp!%(params)s) {
+  %(owner)s {
+    repositories(first: 50, orderBy: {field: PUSHED_AT, direction: DESC},
+                 ownerAffiliations: [%(affiliations)s]) {
+      nodes {
+        nameWithOwner
+        defaultBranchRef {
+          target {
+            ... on Commit {
+              history(first: 20, since: $since, until: $until) {
+                nodes {
+                  authoredDate
+                  message
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+RECENT_COMMITS_QUERY = _RECENT_COMMITS_TEMPLATE % {
+    "params": "", "owner": "viewer", "affiliations": "OWNER, COLLABORATOR, ORGANIZATION_MEMBER"}
+# another user's own repos: affiliations are only visible for the viewer, and
+# /users/{login}/repos lists the same set
+USER_RECENT_COMMITS_QUERY = _RECENT_COMMITS_TEMPLATE % {
+    "params": ", $login: String!", "owner": "user(login: $login)", "affiliations": "OWNER"}
 
-    rows = {"today": [], "yesterday": []}
 
-    # get only recently-updated repos
-    r = requests.get(
-        f"https://api.github.com/user/repos",
-        headers=HEADERS,
+def _rest_recent_commits(since, until, workers=None, login=None):
+    # get only recently-updated repos (the owner's list includes private
+    # repos, so it and their commits stay on GITHUB_TOKEN)
+    own = is_own_login(login)
+    r = conditional_get(
+        f"{API_URL}/user/repos" if own else f"{API_URL}/users/{login}/repos",
         params={"per_page": 50, "sort": "pushed"},
-        timeout=15
+        timeout=15,
+        primary=own
     )
 
-    repos = r.json()
+    names = [repo["full_name"] for repo in response_json(r)]
 
-    for repo in repos:
-        name = repo["full_name"]
+    commits = [(c["commit"]["author"]["date"], c["commit"]["message"])
+               for commits in _fan_out_repo_commits(names, since, until, workers, own)
+               for c in commits]
+    # a scan cut short by an open circuit would pass for an empty day
+    breakers["commits"].check()
+    return commits
 
-        since = datetime.combine(yesterday, datetime.min.time(), tzinfo=timezone.utc).isoformat()
-        until = datetime.combine(today, datetime.max.time(), tzinfo=timezone.utc).isoformat()
 
-        cr = requests.get(
-            f"https://api.github.com/repos/{name}/commits",
-            headers=HEADERS,
-            params={"since": since, "until": until, "per_page": 20},
-            timeout=15
-        )
+def _graphql_recent_commits(since, until, login=None):
+    # same repos (50 most recently pushed) and same 20-commit window as REST,
+    # but in one request
+    if is_own_login(login):
+        query, variables = RECENT_COMMITS_QUERY, {"since": since, "until": until}
+    else:
+        query, variables = USER_RECENT_COMMITS_QUERY, {"since": since, "until": until, "login": login}
+    def send():
+        return http_session().post(GRAPHQL_URL, headers=token_pool.acquire("graphql", primary=is_own_login(login)),
+                                   json={"query": query, "variables": variables}, timeout=15)
 
-        if cr.status_code != 200:
-            continue
+    return _parse_recent_commits(response_json(call_github("graphql", send)))
 
-        for c in cr.json():
-            commit = c["commit"]
-            ts = datetime.strptime(commit["author"]["date"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-            d = ts.date()
 
-            rec = {
-                "date": d.strftime("%d %b %Y"),
-                "time": ts.strftime("%I:%M %p"),
-                "msg": commit["message"][:80]
-            }
+def _parse_recent_commits(data):
+    if "errors" in data:
+        raise GitHubError(data["errors"])
+
+    owner = data["data"].get("viewer") or data["data"]["user"]
+    commits = []
+    for repo in owner["repositories"]["nodes"]:
+        branch = repo["defaultBranchRef"]
+        if not branch or "history" not in branch["target"]:
+            continue  # empty repo
+        for c in branch["target"]["history"]["nodes"]:
+            commits.append((c["authoredDate"], c["message"]))
+    return commits
+
+
+def _parse_commit_ts(stamp):
+    return datetime.fromisoformat(stamp.replace("Z", "+00:00")).astimezone(timezone.utc)
+
 
-            if d == today:
-                rows["today"].append(rec)
-            elif d == yesterday:
-                rows["yesterday"].append(rec)
+def _commits_key(workers=None, backend=None, login=None):
+    key = ("recent_commits", backend or config.COMMITS_BACKEND)
+    return key if is_own_login(login) else key + (login.lower(),)
+
+
+@cached(commit_cache, key=_commits_key)
+def fetch_recent_commits(workers=None, backend=None, login=None):
+    today, yesterday, since, until = _commit_window()
+    backend = backend or config.COMMITS_BACKEND
+    last = ("last_rows",) + _commits_key(workers, backend, login)
+
+    # the commit tables are low priority: when the budget is low, keep
+    # showing the last rows instead of spending 1 + repos REST calls
+    resource, planned = ("graphql", 1) if backend == "graphql" else ("core", 51)
+    if not token_pool.allows(resource, planned, low_priority=True, primary=is_own_login(login)):
+        rate_budget.count("deferred")
+        return commit_cache.get(last) or {"today": [], "yesterday": []}
+
+    try:
+        if backend == "graphql":
+            commits = _graphql_recent_commits(since, until, login)
+        else:
+            commits = _rest_recent_commits(since, until, workers, login)
+    except fallback_errors():
+        # GitHub is failing or the budget ran out mid-scan: the last tables
+        # (or empty ones) beat taking the page down, or caching half a scan
+        count_fallback("commits")
+        return commit_cache.get(last) or {"today": [], "yesterday": []}
+
+    rows = _commit_rows(commits, today, yesterday)
+    commit_cache.set(last, rows, ttl=24 * 3600)
+    return rows
+
+
+def _commit_window(now=None):
+    today = (now or datetime.now(timezone.utc)).date()
+    yesterday = today - timedelta(days=1)
+    since = datetime.combine(yesterday, datetime.min.time(), tzinfo=timezone.utc).isoformat()
+    until = datetime.combine(today, datetime.max.time(), tzinfo=timezone.utc).isoformat()
+    return today, yesterday, since, until
+
+
+def _commit_rows(commits, today, yesterday):
+    rows = {"today": [], "yesterday": []}
+
+    for stamp, message in commits:
+        ts = _parse_commit_ts(stamp)
+        d = ts.date()
+
+        rec = {
+            "date": d.strftime("%d %b %Y"),
+            "time": ts.strftime("%I:%M %p"),
+            "msg": message[:80]
+        }
+
+        if d == today:
+            rows["today"].append(rec)
+        elif d == yesterday:
+            rows["yesterday"].append(rec)
 
     rows["today"].sort(key=lambda x: x["time"], reverse=True)
     rows["yesterday"].sort(key=lambda x: x["time"], reverse=True)
-
-    _commit_cache["ts"] = datetime.utcnow()
-    _commit_cache["data"] = rows
     return rows
 
 
-# ---------------- STATS LOGIC ---------------- #
+# ---------------- CALENDAR ---------------- #
 
-def calculate_stats(days):
-    calendar = {datetime.strptime(d["date"], "%Y-%m-%d").date(): d["contributionCount"] for d in days}
-    active_days = [d for d, c in calendar.items() if c > 0]
+class ContributionCalendar:
+    """Day counts in one contiguous unsigned-int array, indexed by day offset.
+
+    ~4 bytes per day instead of a date key, an int value and a dict slot, so
+    18 years of history is ~26 KB. Lookups by date are O(1); dates missing
+    between the first and last day read as 0.
+    """
+
+    TYPECODE = "I"  # 'H' caps out at 65535/day, which bots can exceed
+
+    def __init__(self, base=None, counts=None):
+        self.base = base
+        self.counts = counts if counts is not None else array(self.TYPECODE)
+
+    @classmethod
+    def from_days(cls, days):
+        if days:
+            base = date.fromisoformat(days[0]["date"])
+            if (date.fromisoformat(days[-1]["date"]) - base).days == len(days) - 1:
+                # contiguous, as GitHub and the store return it: no per-day date parsing
+                return cls(base, array(cls.TYPECODE, (d["contributionCount"] for d in days)))
+        cal = cls()
+        for d in days:
+            cal.append(date.fromisoformat(d["date"]), d["contributionCount"])
+        return cal
+
+    def copy(self):
+        return ContributionCalendar(self.base, array(self.TYPECODE, self.counts))
+
+    def __eq__(self, other):
+        if not isinstance(other, ContributionCalendar):
+            return NotImplemented
+        return self.base == other.base and self.counts == other.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def end(self):
+        return self.base + timedelta(days=len(self.counts) - 1) if self.counts else None
+
+    @property
+    def nbytes(self):
+        return self.counts.itemsize * len(self.counts)
+
+    def index(self, d):
+        return (d - self.base).days
+
+    def get(self, d, default=0):
+        if self.base is None:
+            return default
+        i = (d - self.base).days
+        return self.counts[i] if 0 <= i < len(self.counts) else default
+
+    def __getitem__(self, d):
+        return self.get(d)
+
+    def __contains__(self, d):
+        return self.base is not None and 0 <= (d - self.base).days < len(self.counts)
+
+    def items(self):
+        d = self.base
+        for c in self.counts:
+            yield d, c
+            d += timedelta(days=1)
+
+    def extend(self, other):
+        # other's days go after ours; a gap between the two reads as 0
+        if not other.counts:
+            return
+        if self.base is None:
+            self.base = other.base
+        gap = (other.base - self.base).days - len(self.counts)
+        if gap < 0:
+            raise ValueError(f"{other.base} is not after {self.end}")
+        self.counts.extend(self._zeros(gap))
+        self.counts.extend(other.counts)
+
+    def append(self, d, count):
+        if self.base is None:
+            self.base = d
+        gap = (d - self.base).days - len(self.counts)
+        if gap < 0:
+            raise ValueError(f"{d} is not after {self.end}")
+        if gap:
+            self.counts.extend(self._zeros(gap))
+        self.counts.append(count)
+
+    def pop(self):
+        self.counts.pop()
+        if not self.counts:
+            self.base = None
+
+    def _zeros(self, n):
+        return array(self.TYPECODE, bytes(n * self.counts.itemsize))
+
+    def window(self, start, end):
+        # counts for start..end inclusive, 0 outside the stored range
+        n = (end - start).days + 1
+        if self.base is None or n <= 0:
+            return self._zeros(max(n, 0))
+        lo = (start - self.base).days
+        out = self.counts[max(lo, 0):max(min(lo + n, len(self.counts)), 0)]
+        head = min(max(-lo, 0), n)
+        return self._zeros(head) + out + self._zeros(n - head - len(out))
+
+    def range_sum(self, start, end):
+        return sum(self.window(start, end))
+
+
+def run_bounds(counts):
+    """Start and end offsets (inclusive) of every run of non-zero counts.
+
+    With NumPy this is one diff over the padded activity mask: +1 marks a
+    run start, -1 the day after a run ends.
+    """
+    if np is not None:
+        if isinstance(counts, array):
+            active = np.frombuffer(counts, dtype=f"u{counts.itemsize}") > 0
+        else:
+            active = np.asarray(counts) > 0
+        edges = np.diff(np.concatenate(([0], active.view(np.int8), [0])))
+        return np.flatnonzero(edges == 1).tolist(), (np.flatnonzero(edges == -1) - 1).tolist()
+
+    starts, ends, start = [], [], None
+    for i, c in enumerate(counts):
+        if c > 0:
+            if start is None:
+                start = i
+        elif start is not None:
+            starts.append(start)
+            ends.append(i - 1)
+            start = None
+    if start is not None:
+        starts.append(start)
+        ends.append(len(counts) - 1)
+    return starts, ends
+
+
+def streak_analytics(calendar, today=None, top=5):
+    """Every streak in the calendar at once: longest, current, top-N, gaps.
+
+    Ties for longest/top-N go to the earlier run, like calculate_stats().
+    """
+    today = today or datetime.now(timezone.utc).date()
+    starts, ends = run_bounds(calendar.counts)
+    day = lambda i: calendar.base + timedelta(days=i)
+
+    if np is not None and starts:
+        lengths = (np.asarray(ends) - np.asarray(starts) + 1)
+        order = np.argsort(-lengths, kind="stable")[:top].tolist()
+        lengths = lengths.tolist()
+        gaps = (np.asarray(starts[1:]) - np.asarray(ends[:-1]) - 1).tolist()
+    else:
+        lengths = [b - a + 1 for a, b in zip(starts, ends)]
+        order = sorted(range(len(lengths)), key=lambda i: -lengths[i])[:top]
+        gaps = [s - e - 1 for s, e in zip(starts[1:], ends[:-1])]
+
+    runs = [{"length": lengths[i], "start": day(starts[i]), "end": day(ends[i])} for i in order]
+
+    current = {"length": 0, "start": None, "end": None}
+    if starts:
+        for cs_end in (today, today - timedelta(days=1)):
+            if calendar.get(cs_end) > 0:
+                i = bisect_right(starts, calendar.index(cs_end)) - 1
+                current = {"length": calendar.index(cs_end) - starts[i] + 1,
+                           "start": day(starts[i]), "end": cs_end}
+                break
+
+    return {
+        "longest": runs[0] if runs else {"length": 0, "start": None, "end": None},
+        "current": current,
+        "top": runs,
+        "runs": len(starts),
+        "active_days": sum(lengths),
+        "gaps": {
+            "count": len(gaps),
+            "longest": max(gaps, default=0),
+            "mean": round(sum(gaps) / len(gaps), 2) if gaps else 0,
+        },
+    }
 
-    total_start, total_end = min(active_days), max(active_days)
 
-    longest = temp = 0
-    ls_start = ls_end = None
-    cur_start = None
+# ---------------- STATS LOGIC ---------------- #
+
+class StreakEngine:
+    """Running streak state for a contribution calendar.
+
+    Days are appended oldest-first and each append is O(1): the engine keeps
+    the run ending at the last day, the run a zero day last closed (needed
+    when today is 0 but yesterday isn't), the longest run and the active-day
+    bounds, over a ContributionCalendar. Missing dates count as zero days.
+    Changing the last day rolls back one step; changing anything older
+    triggers a full rebuild.
+    """
 
-    for d in sorted(calendar):
-        if calendar[d] > 0:
-            temp += 1
-            if temp == 1:
-                cur_start = d
-            if temp > longest:
-                longest, ls_start, ls_end = temp, cur_start, d
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rebuilds = 0
+        self.reset()
+
+    def reset(self):
+        self.calendar = ContributionCalendar()
+        self.last = None
+        self.run_len = 0
+        self.run_start = None
+        self.closed_run = (None, None, 0)
+        self.longest = 0
+        self.longest_range = (None, None)
+        self.active_range = (None, None)
+        self._undo = None
+
+    def _state(self):
+        return (self.last, self.run_len, self.run_start, self.closed_run,
+                self.longest, self.longest_range, self.active_range)
+
+    def append(self, d, count):
+        if self.last is not None and d <= self.last:
+            raise ValueError(f"{d} is not after {self.last}")
+
+        self._undo = self._state()
+        if self.last is not None and d != self.last + timedelta(days=1) and self.run_len:
+            # a gap in the dates is a run of zero days
+            self.closed_run = (self.run_start, self.last, self.run_len)
+            self.run_len = 0
+
+        self.calendar.append(d, count)
+        if count > 0:
+            if self.run_len == 0:
+                self.run_start = d
+            self.run_len += 1
+            if self.run_len > self.longest:
+                self.longest, self.longest_range = self.run_len, (self.run_start, d)
+            first = self.active_range[0] or d
+            self.active_range = (first, d)
+        elif self.run_len:
+            self.closed_run = (self.run_start, self.last, self.run_len)
+            self.run_len = 0
+        self.last = d
+
+    def _replace_last(self, count):
+        d = self.last
+        (self.last, self.run_len, self.run_start, self.closed_run,
+         self.longest, self.longest_range, self.active_range) = self._undo
+        self.calendar.pop()
+        self.append(d, count)
+
+    def _load(self, calendar):
+        # state for everything but the last day in one pass over the run
+        # bounds, then a normal append so _undo is right for _replace_last
+        counts = calendar.counts[:-1]
+        self.calendar = ContributionCalendar(calendar.base, counts)
+        self.last = calendar.end - timedelta(days=1) if len(counts) else None
+        starts, ends = run_bounds(counts)
+        day = lambda i: calendar.base + timedelta(days=i)
+
+        if starts:
+            lengths = [b - a + 1 for a, b in zip(starts, ends)]
+            best = lengths.index(max(lengths))
+            self.longest = lengths[best]
+            self.longest_range = (day(starts[best]), day(ends[best]))
+            self.active_range = (day(starts[0]), day(ends[-1]))
+            if ends[-1] == len(counts) - 1:
+                self.run_len, self.run_start = lengths[-1], day(starts[-1])
+                if len(starts) > 1:
+                    self.closed_run = (day(starts[-2]), day(ends[-2]), lengths[-2])
+            else:
+                self.closed_run = (day(starts[-1]), day(ends[-1]), lengths[-1])
+
+        self.append(calendar.end, calendar.counts[-1])
+
+    def rebuild(self, days):
+        self.reset()
+        self.rebuilds += 1
+        if isinstance(days, ContributionCalendar):
+            if len(days):
+                self._load(days)
         else:
-            temp = 0
+            for d in days:
+                self.append(date.fromisoformat(d["date"]), d["contributionCount"])
+
+    def update(self, days):
+        # days: the full calendar as a ContributionCalendar (what
+        # fetch_contributions() returns) or as day dicts, oldest first
+        with self.lock:
+            if isinstance(days, ContributionCalendar):
+                self._update_calendar(days)
+                return
+            known = len(self.calendar)
+            if (known == 0 or len(days) < known
+                    or days[0]["date"] != self.calendar.base.isoformat()
+                    or days[known - 1]["date"] != self.last.isoformat()):
+                self.rebuild(days)
+                return
+
+            # same span as what we hold, so positions line up day for day
+            head = array(ContributionCalendar.TYPECODE, (d["contributionCount"] for d in days[:known]))
+            if head[:-1] != self.calendar.counts[:-1]:
+                self.rebuild(days)
+                return
+            if head[-1] != self.calendar.counts[-1]:
+                self._replace_last(head[-1])
+
+            for d in days[known:]:
+                self.append(date.fromisoformat(d["date"]), d["contributionCount"])
+
+    def _update_calendar(self, calendar):
+        # same diff as for day dicts, but on the count arrays: equal bases
+        # line positions up, so the held days are one slice compare
+        known = len(self.calendar)
+        if known == 0 or calendar.base != self.calendar.base or len(calendar) < known:
+            self.rebuild(calendar)
+            return
+        if calendar.counts[:known - 1] != self.calendar.counts[:known - 1]:
+            self.rebuild(calendar)
+            return
+        if calendar.counts[known - 1] != self.calendar.counts[-1]:
+            self._replace_last(calendar.counts[known - 1])
+
+        d = self.last
+        for count in calendar.counts[known:]:
+            d += timedelta(days=1)
+            self.append(d, count)
+
+    def current(self, today):
+        yesterday = today - timedelta(days=1)
+        if self.calendar.get(today) > 0:
+            cs_end = today
+        elif self.calendar.get(yesterday) > 0:
+            cs_end = yesterday
+        else:
+            return 0, (None, None)
+
+        if cs_end == self.last:
+            return self.run_len, (self.run_start, cs_end)
+        if cs_end == self.closed_run[1]:
+            return self.closed_run[2], (self.closed_run[0], cs_end)
+
+        # calendar runs past today (timezone skew): walk back the slow way
+        current, d = 0, cs_end
+        while self.calendar.get(d) > 0:
+            current += 1
+            d -= timedelta(days=1)
+        return current, (d + timedelta(days=1), cs_end)
+
+    def stats(self, today=None):
+        today = today or datetime.now(timezone.utc).date()
+        with self.lock:
+            current, current_range = self.current(today)
+            return {
+                "total_range": self.active_range,
+                "current": current,
+                "current_range": current_range,
+                "longest": self.longest,
+                "longest_range": self.longest_range,
+                "calendar": self.calendar.copy(),  # snapshots must not see later appends
+            }
 
-    today = datetime.now(timezone.utc).date()
-    if calendar.get(today, 0) > 0:
-        cs_end = today
-    elif calendar.get(today - timedelta(days=1), 0) > 0:
-        cs_end = today - timedelta(days=1)
+
+streak_engine = StreakEngine()
+
+
+def calculate_stats(days, engine=None):
+    # days: fetch_contributions() output (or day dicts); pass the shared
+    # streak_engine to only process days added since last time
+    if engine is None:
+        engine = StreakEngine()
+    engine.update(days)
+    return engine.stats()
+
+
+# ---------------- HEATMAP ---------------- #
+
+FIXED_THRESHOLDS = (1, 3, 6, 10)
+LEVEL_CLASSES = ("", "l1", "l2", "l3", "l4")
+
+
+def quartile_thresholds(counts):
+    # level 1 for any activity, then one level per quartile of the active days;
+    # both paths pick the lower neighbour (no interpolation), so they agree
+    if np is not None:
+        values = np.asarray(counts)
+        active = values[values > 0]
+        if not active.size:
+            return FIXED_THRESHOLDS
+        q = np.percentile(active, [25, 50, 75], method="lower").tolist()
     else:
-        return {"total_range": (total_start, total_end), "current": 0,
-                "current_range": (None, None), "longest": longest,
-                "longest_range": (ls_start, ls_end), "calendar": calendar}
+        active = sorted(c for c in counts if c > 0)
+        if not active:
+            return FIXED_THRESHOLDS
+        q = [active[int(p * (len(active) - 1))] for p in (0.25, 0.5, 0.75)]
+    return (1,) + tuple(int(x) + 1 for x in q)
+
+
+def resolve_thresholds(mode, counts):
+    mode = mode or config.HEATMAP_THRESHOLDS
+    if mode == "fixed":
+        return FIXED_THRESHOLDS
+    if mode == "quartile":
+        return quartile_thresholds(counts)
+    bounds = mode if isinstance(mode, tuple) else tuple(int(x) for x in mode.split(","))
+    # one lower bound per level 1-4; anything else would index past LEVEL_COLOURS
+    if len(bounds) != len(LEVEL_CLASSES) - 1 or bounds[0] < 1 or any(a >= b for a, b in zip(bounds, bounds[1:])):
+        raise ValueError(f"thresholds must be 4 ascending positive ints, got {mode!r}")
+    return bounds
+
+
+def heatmap_levels(calendar, start, end, thresholds=None):
+    """Level 0-4 for every day from start to end inclusive, in one pass.
+
+    thresholds are the lower bounds of levels 1-4 (or a mode name, see
+    HEATMAP_THRESHOLDS); a day's level is how many of them it reaches.
+    """
+    counts = calendar.window(start, end)
+    bounds = resolve_thresholds(thresholds, counts)
+
+    if np is not None:
+        values = np.frombuffer(counts, dtype=f"u{counts.itemsize}")
+        return array("B", np.searchsorted(np.asarray(bounds), values, side="right").astype(np.uint8).tobytes())
+    return array("B", (bisect_right(bounds, c) for c in counts))
+
+
+LEVEL_COLOURS = ("#161b22", "#0e4429", "#006d32", "#26a641", "#39d353")
+CELL, GAP = 10, 2
+
+
+def _cell_positions(start, n):
+    # (column, row) for each day: one column per week, Sunday on top
+    first = (start.weekday() + 1) % 7
+    return [((first + i) // 7, (first + i) % 7) for i in range(n)]
+
+
+def render_heatmap_svg(levels, start):
+    # one <path> per level instead of one element per day
+    step = CELL + GAP
+    paths = [[] for _ in LEVEL_COLOURS]
+    cols = 0
+    for lvl, (col, row) in zip(levels, _cell_positions(start, len(levels))):
+        paths[lvl].append(f"M{col * step} {row * step}h{CELL}v{CELL}h-{CELL}z")
+        cols = col + 1
+    width, height = cols * step - GAP, 7 * step - GAP
+    body = "".join(f'<path fill="{colour}" d="{"".join(p)}"/>'
+                   for colour, p in zip(LEVEL_COLOURS, paths) if p)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{max(width, 0)}" height="{height}" '
+            f'viewBox="0 0 {max(width, 0)} {height}">{body}</svg>')
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def render_heatmap_png(levels, start, background="#0d1117"):
+    # minimal truecolour PNG: IHDR, one zlib-compressed IDAT, IEND
+    step = CELL + GAP
+    rgb = lambda h: bytes.fromhex(h[1:])
+    cols = max((c for c, _ in _cell_positions(start, len(levels))), default=-1) + 1
+    width, height = max(cols * step - GAP, 1), 7 * step - GAP
+
+    grid = [[None] * cols for _ in range(7)]
+    for lvl, (col, row) in zip(levels, _cell_positions(start, len(levels))):
+        grid[row][col] = rgb(LEVEL_COLOURS[lvl])
+
+    bg = rgb(background)
+    raw = bytearray()
+    for y in range(height):
+        row, inside = divmod(y, step)
+        line = bytearray()
+        for col in range(cols):
+            colour = grid[row][col] if inside < CELL and grid[row][col] else bg
+            line += colour * CELL
+            if col < cols - 1:
+                line += bg * GAP
+        raw += b"\x00" + bytes(line or bg)  # filter type 0 per scanline
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(bytes(raw), 9)) + _png_chunk(b"IEND", b""))
+
+
+heatmap_cache = TTLCache(maxsize=64, ttl=24 * 3600)
+
+
+def snapshot_heatmap(snapshot, start, end, thresholds=None):
+    # cached per snapshot, window and threshold mode
+    key = (snapshot_digest(snapshot), start, end, thresholds or config.HEATMAP_THRESHOLDS)
+    levels = heatmap_cache.get(key)
+    if levels is None:
+        levels = heatmap_levels(snapshot["stats"]["calendar"], start, end, thresholds)
+        heatmap_cache.set(key, levels)
+    return levels
+
+
+# ---------------- SNAPSHOTS ---------------- #
+
+def build_snapshot(login=None, engine=None, contributions=None):
+    # login defaults to GITHUB_USERNAME; other users need their own engine.
+    # contributions: (total, calendar) already fetched, e.g. in a shared query
+    total, calendar = contributions or fetch_contributions(login=login)
+    return assemble_snapshot(total, calendar, fetch_recent_commits(login=login), engine, login)
+
+
+def assemble_snapshot(total, calendar, commits, engine=None, login=None):
+    stats = calculate_stats(calendar, engine or streak_engine)
+    snapshot = {
+        "login": login or config.GITHUB_USERNAME,
+        "total": total,
+        "stats": stats,
+        "analytics": streak_analytics(stats["calendar"]),
+        "commits": commits,
+        "built_at": datetime.now(timezone.utc),
+        "built_mono": time.monotonic(),
+    }
+    snapshot["digest"] = snapshot_digest(snapshot)
+    return snapshot
+
+
+def snapshot_digest(snapshot):
+    # identifies the data a snapshot renders, not when it was built
+    if "digest" in snapshot:
+        return snapshot["digest"]
+    stats, cal = snapshot["stats"], snapshot["stats"]["calendar"]
+    h = hashlib.sha256()
+    h.update(repr((snapshot.get("login"), snapshot["total"], cal.base, stats["total_range"], stats["current"],
+                   stats["current_range"], stats["longest"], stats["longest_range"])).encode())
+    h.update(cal.counts.tobytes())
+    h.update(json.dumps(snapshot["commits"], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class SnapshotRefresher:
+    """Keeps the latest dashboard snapshot warm.
+
+    get() never waits once a snapshot exists: a stale one is returned as-is
+    and a refresh is kicked off in the background. Only one refresh runs at
+    a time, so concurrent requests can't stampede the API.
+    """
+
+    def __init__(self, build, interval, background=True):
+        self.build = build
+        self.interval = interval
+        self.background = background
+        self.snapshot = None
+        self.last_error = None
+        self.failures = 0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def age(self):
+        if self.snapshot is None:
+            return None
+        return time.monotonic() - self.snapshot["built_mono"]
+
+    def refreshing(self):
+        return self._refresh_lock.locked()
+
+    def refresh(self, wait=False, build=None):
+        # build: stands in for self.build this once
+        if not self._refresh_lock.acquire(blocking=wait):
+            return False  # another refresh is already in flight
+        try:
+            if wait and self.snapshot is not None and self.age() < self.interval:
+                return True  # built by the refresh we were waiting on
+            try:
+                snapshot = (build or self.build)()
+            except Exception as e:
+                self.last_error = repr(e)
+                self.failures += 1
+                if self.snapshot is None:
+                    raise
+                return False
+            self.snapshot = snapshot
+            self.last_error = None
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def get(self):
+        if self.background:
+            self.start()
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            self.refresh(wait=True)
+            return self.snapshot
+
+        if self.age() >= self.interval and not self.refreshing():
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return snapshot
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh(wait=True)
+            except Exception:
+                pass  # recorded in last_error, retried next tick
+            self._stop.wait(self.interval)
+
+    def health(self):
+        age = self.age()
+        return {
+            "status": "empty" if age is None else "stale" if age >= 2 * self.interval else "ok",
+            "snapshot_age": None if age is None else round(age, 3),
+            "built_at": self.snapshot["built_at"].isoformat() if self.snapshot else None,
+            "refresh_interval": self.interval,
+            "refreshing": self.refreshing(),
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
 
-    current = 0
-    d = cs_end
-    cs_start = None
+refresher = deferred(lambda: SnapshotRefresher(build_snapshot, config.REFRESH_INTERVAL,
+                                                background=config.BACKGROUND_REFRESH))
 
-    while calendar.get(d, 0) > 0:
-        cs_start = d
-        current += 1
-        d -= timedelta(days=1)
 
+# ---------------- MULTI-USER ---------------- #
+
+class RateLimiter:
+    """Token bucket: `rate` tokens per `per` seconds, bursting up to `rate`."""
+
+    def __init__(self, rate, per=60.0, clock=time.monotonic):
+        self.rate = rate
+        self.per = per
+        self.clock = clock
+        self.tokens = float(rate)
+        self.stamp = clock()
+        self.lock = threading.Lock()
+
+    def _fill(self):
+        now = self.clock()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate / self.per)
+        self.stamp = now
+
+    def take(self, n=1):
+        with self.lock:
+            self._fill()
+            if self.tokens < n:
+                return False
+            self.tokens -= n
+            return True
+
+    def available(self):
+        with self.lock:
+            self._fill()
+            return int(self.tokens)
+
+
+class FetchScheduler:
+    """One background loop that refreshes snapshots for every tracked user.
+
+    Viewing a page touches the user's refresher. Each tick, stale refreshers
+    of users viewed within `active_window` are refreshed most recently viewed
+    first, at most `workers` at a time and no faster than the rate limiter
+    allows, so a crowd of users shares one GitHub budget instead of each
+    page view spending its own. Users nobody looks at drop out until they're
+    viewed again.
+
+    The calendars of the users refreshed in one tick are synced together,
+    as aliased team queries; only the commit tables are fetched per user.
+    """
+
+    def __init__(self, workers, per_minute, active_window, tick=1.0, clock=time.monotonic):
+        self.workers = workers
+        self.limiter = RateLimiter(per_minute, 60.0, clock)
+        self.active_window = active_window
+        self.tick = tick
+        self.clock = clock
+        self.jobs = {}  # key -> (refresher, last viewed)
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stats = {"refreshes": 0, "failures": 0, "deferred": 0, "batched": 0}
+        self._pool = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, key, refresher):
+        with self.lock:
+            self.jobs[key] = (refresher, self.clock())
+        self.start()
+
+    def forget(self, key):
+        with self.lock:
+            self.jobs.pop(key, None)
+
+    def due(self):
+        # [(key, refresher)] that are stale, idle and recently viewed, newest view first
+        now = self.clock()
+        with self.lock:
+            for key in [k for k, (_, seen) in self.jobs.items() if now - seen >= self.active_window]:
+                del self.jobs[key]
+            ready = [(seen, key, r) for key, (r, seen) in self.jobs.items()
+                     if key not in self.running and r.snapshot is not None and r.age() >= r.interval]
+        ready.sort(key=lambda job: job[0], reverse=True)
+        return [(key, r) for _, key, r in ready]
+
+    def run_once(self):
+        started = []
+        for key, r in self.due()[:max(self.workers - len(self.running), 0)]:
+            # a refresh is a delta or batched query plus the commit tables
+            if not token_pool.allows("graphql", 2, low_priority=True, primary=is_own_login(key)):
+                rate_budget.count("deferred")
+                with self.lock:
+                    self.stats["deferred"] += 1
+                break
+            if not self.limiter.take():
+                with self.lock:
+                    self.stats["deferred"] += 1
+                break
+            with self.lock:
+                self.running.add(key)
+            started.append((key, r))
+        if started:
+            self._pool.submit(self._refresh_all, started)
+        return len(started)
+
+    def _refresh_all(self, jobs):
+        # one team sync for everyone's calendar (the owner's needs GITHUB_TOKEN,
+        # so it isn't shared), then each user's snapshot on its own pool thread
+        logins = [key for key, _ in jobs if not is_own_login(key)]
+        try:
+            found = fetch_team_contributions(logins) if logins else {}
+        except Exception:
+            found = {}  # each refresh syncs (or falls back to the store) on its own
+        for key, r in jobs:
+            self._pool.submit(self._refresh, key, r, found.get(key))
+
+    def _refresh(self, key, refresher, contributions=None):
+        ok = False
+        try:
+            if contributions is None:
+                ok = refresher.refresh(wait=True)
+            else:
+                ok = refresher.refresh(wait=True, build=functools.partial(refresher.build,
+                                                                          contributions=contributions))
+        except Exception:
+            pass  # recorded on the refresher
+        with self.lock:
+            self.running.discard(key)
+            self.stats["refreshes" if ok else "failures"] += 1
+            self.stats["batched"] += ok and contributions is not None
+
+    def start(self):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._pool = futures.ThreadPoolExecutor(max_workers=max(self.workers, 1),
+                                            thread_name_prefix="user-fetch")
+            self._thread = threading.Thread(target=self._run, name="fetch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            self.run_once()
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, tracked=len(self.jobs), running=len(self.running),
+                        budget=self.limiter.available())
+
+
+class UserSnapshots:
+    """Snapshot refreshers for /u/<login>, least recently viewed evicted first.
+
+    Each user gets their own StreakEngine, so incremental updates don't
+    clobber each other. Only a user's first snapshot is built inline; after
+    that pages are served from the cached snapshot and the scheduler keeps
+    it fresh (without a scheduler, stale snapshots refresh on demand).
+    """
+
+    def __init__(self, maxsize, interval, scheduler=None):
+        self.maxsize = maxsize
+        self.interval = interval
+        self.scheduler = scheduler
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.failed = TTLCache(maxsize=1024, ttl=config.USER_NEGATIVE_TTL)
+
+    def refresher(self, login):
+        key = login.lower()
+        evicted = []
+        with self.lock:
+            r = self.entries.get(key)
+            if r is None:
+                build = functools.partial(build_snapshot, key, StreakEngine())
+                r = self.entries[key] = SnapshotRefresher(build, self.interval, background=False)
+                while len(self.entries) > self.maxsize:
+                    evicted.append(self.entries.popitem(last=False)[0])
+                    self.evictions += 1
+            else:
+                self.entries.move_to_end(key)
+        if self.scheduler is not None:
+            for old in evicted:
+                self.scheduler.forget(old)
+        return r
+
+    def drop(self, login):
+        key = login.lower()
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.scheduler is not None:
+            self.scheduler.forget(key)
+
+    def get(self, login):
+        key = login.lower()
+        found = self.failed.peek(key)
+        if found is not None:
+            raise found[0]
+
+        r = self.refresher(key)
+        try:
+            if self.scheduler is None:
+                return r.get()
+            self.scheduler.touch(key, r)
+            if r.snapshot is None:
+                r.refresh(wait=True)
+            return r.snapshot
+        except Exception as e:
+            # unknown login, or GitHub down with nothing cached: don't hold a slot
+            self.failed.set_negative(key, e)
+            self.drop(key)
+            raise
+
+    def info(self):
+        with self.lock:
+            info = {"users": len(self.entries), "maxsize": self.maxsize, "evictions": self.evictions}
+        if self.scheduler is not None:
+            info["scheduler"] = self.scheduler.info()
+        return info
+
+
+user_scheduler = deferred(lambda: FetchScheduler(config.USER_FETCH_WORKERS, config.USER_REFRESHES_PER_MINUTE,
+                                                 config.USER_ACTIVE_WINDOW))
+users = deferred(lambda: UserSnapshots(config.USER_CACHE_SIZE, config.USER_REFRESH_INTERVAL,
+                                       user_scheduler if config.BACKGROUND_REFRESH else None))
+
+
+def user_snapshot(login):
+    # the configured user keeps the main refresher
+    return main_snapshot() if is_own_login(login) else users.get(login)
+
+
+# ---------------- TEAM ---------------- #
+
+def fetch_team_contributions(logins, workers=None, now=None):
+    """(total, ContributionCalendar) for every login, or None for logins
+    GitHub doesn't know.
+
+    Each member gets the same plan as sync_contributions() (nothing, a
+    delta window or the missing years), but all the windows go out together
+    as aliased multi-user queries, so a refresh of a synced team costs about
+    len(logins) / TEAM_BATCH_WINDOWS requests.
+    """
+    now = now or datetime.now(timezone.utc)
+    store = get_calendar_store()
+
+    plans, units = {}, []
+    for login in logins:
+        plan, arg = _sync_plan(store, login, now) if store is not None else ("years", year_windows(now))
+        plans[login] = plan, arg
+        if plan == "delta":
+            units.append((login, arg))
+        elif plan == "years":
+            units.extend((login, w) for w in arg)
+
+    fetched = {}
+    for (login, window), cal in zip(units, fetch_team_calendars(units, workers)):
+        fetched.setdefault(login, []).append((window, cal))
+
+    results = {}
+    for login in logins:
+        plan, _ = plans[login]
+        pairs = fetched.get(login, [])
+        if any(cal is None for _, cal in pairs):
+            results[login] = None
+        elif store is None:
+            results[login] = _join_calendars([cal for _, cal in pairs])
+        else:
+            if plan == "delta":
+                store.save_delta(login, pairs[0][1]["calendar"], now)
+            elif plan == "years":
+                store.save_years(login, [w for w, _ in pairs], [cal for _, cal in pairs], now)
+            results[login] = store.load_calendar(login)
+    return results
+
+
+def team_leaderboard(members, today=None):
+    """Total and streak row for every member, computed in bulk.
+
+    members maps login -> (total, days or a ContributionCalendar); None
+    entries are skipped. All the calendars are laid end to end in one array
+    with a zero day between members, so a single run_bounds() pass finds
+    everyone's runs.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    logins = [login for login, found in members.items() if found is not None]
+    cals = [days if isinstance(days, ContributionCalendar) else ContributionCalendar.from_days(days)
+            for days in (members[login][1] for login in logins)]
+
+    flat, offsets = array(ContributionCalendar.TYPECODE), []
+    for cal in cals:
+        offsets.append(len(flat))
+        flat.extend(cal.counts)
+        flat.append(0)
+    starts, ends = run_bounds(flat)
+
+    # member -> index of their longest run (the earliest one on ties)
+    if np is not None and starts:
+        s, e = np.asarray(starts), np.asarray(ends)
+        owner = np.searchsorted(np.asarray(offsets), s, side="right") - 1
+        order = np.lexsort((s, s - e, owner))
+        owners, first = np.unique(owner[order], return_index=True)
+        longest = dict(zip(owners.tolist(), order[first].tolist()))
+    else:
+        longest = {}
+        for k, a in enumerate(starts):
+            i = bisect_right(offsets, a) - 1
+            best = longest.get(i)
+            if best is None or ends[k] - a > ends[best] - starts[best]:
+                longest[i] = k
+
+    none = {"length": 0, "start": None, "end": None}
+    rows = []
+    for i, (login, cal) in enumerate(zip(logins, cals)):
+        day = lambda pos: cal.base + timedelta(days=pos - offsets[i])
+        row = {"login": login, "total": members[login][0],
+               "last_year": cal.range_sum(today - timedelta(days=364), today) if cal.base else 0,
+               "current": none, "longest": none}
+        k = longest.get(i)
+        if k is not None:
+            row["longest"] = {"length": ends[k] - starts[k] + 1, "start": day(starts[k]), "end": day(ends[k])}
+        for cs_end in (today, today - timedelta(days=1)):
+            if cal.get(cs_end) > 0:
+                pos = offsets[i] + cal.index(cs_end)
+                k = bisect_right(starts, pos) - 1
+                row["current"] = {"length": pos - starts[k] + 1, "start": day(starts[k]), "end": cs_end}
+                break
+        rows.append(row)
+    return rows
+
+
+def leaderboards(rows):
+    # highest first, ties by login
+    rank = lambda score: sorted(rows, key=lambda r: (-score(r), r["login"]))
     return {
-        "total_range": (total_start, total_end),
-        "current": current,
-        "current_range": (cs_start, cs_end),
-        "longest": longest,
-        "longest_range": (ls_start, ls_end),
-        "calendar": calendar
+        "total": rank(lambda r: r["total"]),
+        "last_year": rank(lambda r: r["last_year"]),
+        "current": rank(lambda r: r["current"]["length"]),
+        "longest": rank(lambda r: r["longest"]["length"]),
+    }
+
+
+# member rows, per login and day (current streaks move with the date)
+team_cache = deferred(lambda: TTLCache(maxsize=4096, ttl=config.TEAM_REFRESH_INTERVAL))
+
+
+def build_team_snapshot(logins=None, workers=None):
+    logins = [login.lower() for login in (logins or config.TEAM_LOGINS)]
+    today = datetime.now(timezone.utc).date()
+
+    rows, stale = {}, []
+    for login in logins:
+        found = team_cache.peek(("member", login, today))
+        if found is None:
+            stale.append(login)
+        elif not found[1]:
+            rows[login] = found[0]
+
+    valid = [login for login in stale if LOGIN_RE.fullmatch(login)]
+    if valid:
+        members = fetch_team_contributions(valid, workers)
+        for row in team_leaderboard(members, today):
+            team_cache.set(("member", row["login"], today), row)
+            rows[row["login"]] = row
+        for login, found in members.items():
+            if found is None:
+                team_cache.set_negative(("member", login, today), LookupError(login), config.USER_NEGATIVE_TTL)
+
+    team = [rows[login] for login in logins if login in rows]
+    snapshot = {
+        "team": team,
+        "boards": leaderboards(team),
+        "missing": [login for login in logins if login not in rows],
+        "built_at": datetime.now(timezone.utc),
+        "built_mono": time.monotonic(),
     }
+    snapshot["digest"] = hashlib.sha256(repr((team, snapshot["missing"])).encode()).hexdigest()
+    return snapshot
+
+
+team_refresher = deferred(lambda: SnapshotRefresher(build_team_snapshot, config.TEAM_REFRESH_INTERVAL,
+                                                     background=config.BACKGROUND_REFRESH))
 
 
 # ---------------- FLASK UI ---------------- #
 
-app = Flask(__name__)
+_routes = []
+
+
+def route(rule, **options):
+    # records a view; create_app() registers them on the Flask app
+    def decorator(fn):
+        _routes.append((rule, fn, options))
+        return fn
+    return decorator
 
 HTML = """
 <!DOCTYPE html>
@@ -230,49 +2884,130 @@ th{color:#8b949e;}
 <body>
 
 <h2>🔥 GitHub Streak Dashboard (Exact)</h2>
+{% if login %}<div class="sub">@{{login}}</div>{% endif %}
+
+{% include "stat_cards.html" %}
 
+{% include "heatmap.html" %}
+
+<h3 style="margin-top:40px;">🗓 DAILY COMMIT MESSAGE</h3>
+<div class="card" style="flex-direction:column;">
+<h4>(Yesterday)</h4>
+{% with rows = commits.yesterday %}{% include "commit_table.html" %}{% endwith %}
+
+<h4>(Today)</h4>
+{% with rows = commits.today %}{% include "commit_table.html" %}{% endwith %}
+</div>
+
+</body></html>
+"""
+
+STAT_CARDS_HTML = """
 <div class="card">
 <div class="box">{{total}}<div class="label">Total Contributions</div><div class="sub">{{total_start}} → {{total_end}}</div></div>
 <div class="box">{{current}}<div class="label">Current Streak</div><div class="sub">{{cs_start}} → {{cs_end}}</div></div>
 <div class="box">{{longest}}<div class="label">Longest Streak</div><div class="sub">{{ls_start}} → {{ls_end}}</div></div>
 </div>
+"""
 
+HEATMAP_HTML = """
 <div class="heatmap">
 {% for c in cells %}<div class="cell {{c}}"></div>{% endfor %}
 </div>
+"""
 
-<h3 style="margin-top:40px;">🗓 DAILY COMMIT MESSAGE</h3>
-<div class="card" style="flex-direction:column;">
-<h4>(Yesterday)</h4>
+COMMIT_TABLE_HTML = """
 <table><tr><th>Date</th><th>Time</th><th>Commit Message</th></tr>
-{% for r in commits.yesterday %}<tr><td>{{r.date}}</td><td>{{r.time}}</td><td>{{r.msg}}</td></tr>{% endfor %}
+{% for r in rows %}<tr><td>{{r.date}}</td><td>{{r.time}}</td><td>{{r.msg}}</td></tr>{% endfor %}
 </table>
+"""
 
-<h4>(Today)</h4>
-<table><tr><th>Date</th><th>Time</th><th>Commit Message</th></tr>
-{% for r in commits.today %}<tr><td>{{r.date}}</td><td>{{r.time}}</td><td>{{r.msg}}</td></tr>{% endfor %}
-</table>
+TEAM_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+<title>GitHub Streak Leaderboard</title>
+<style>
+body{background:#0d1117;color:white;font-family:Arial;padding:40px;}
+.card{background:#161b22;padding:20px;border-radius:12px;margin-top:20px;}
+.sub{font-size:12px;color:#6e7681;}
+table{width:100%;margin-top:10px;border-collapse:collapse;}
+th,td{padding:6px;font-size:12px;text-align:left;}
+th{color:#8b949e;}
+a{color:#58a6ff;text-decoration:none;}
+</style>
+</head>
+<body>
+
+<h2>🏆 GitHub Streak Leaderboard</h2>
+<div class="sub">{{team|length}} members{% if missing %}, not found: {{missing|join(", ")}}{% endif %}</div>
+
+{% for key, title in boards_shown %}
+<div class="card">
+<h3>{{title}}</h3>
+<table><tr><th>#</th><th>User</th><th>{{title}}</th><th>Since</th></tr>
+{% for r in boards[key][:top] %}<tr><td>{{loop.index}}</td><td><a href="/u/{{r.login}}">{{r.login}}</a></td>
+{% if key in ("current", "longest") %}<td>{{r[key].length}}</td><td>{{fmt(r[key].start)}}</td>{% else %}<td>{{r[key]}}</td><td></td>{% endif %}</tr>
+{% endfor %}</table>
 </div>
+{% endfor %}
 
 </body></html>
 """
 
-@app.route("/")
-def index():
-    total, days = fetch_contributions()
-    stats = calculate_stats(days)
-    commits = fetch_recent_commits()
+TEMPLATES = {
+    "team.html": TEAM_HTML,
+    "dashboard.html": HTML,
+    "stat_cards.html": STAT_CARDS_HTML,
+    "heatmap.html": HEATMAP_HTML,
+    "commit_table.html": COMMIT_TABLE_HTML,
+}
+
+
+def create_app():
+    from jinja2 import ChoiceLoader, DictLoader
+
+    app = flask.Flask(__name__)
+    app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_env.loader])
+    for rule, fn, options in _routes:
+        app.add_url_rule(rule, view_func=fn, **options)
+    return app
+
+
+_app = {"instance": None}
+_app_lock = threading.Lock()
+
+
+def get_app():
+    # the Flask app is built (and flask imported) on first use
+    with _app_lock:
+        if _app["instance"] is None:
+            _app["instance"] = create_app()
+        return _app["instance"]
+
+
+def __getattr__(name):
+    # `app_upgrade.app` (e.g. for WSGI servers) builds the app on access
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def template(name):
+    # parsed and compiled once; render_template() then reuses the compiled version
+    return get_app().jinja_env.get_template(name)
+
+
+def dashboard_context(snapshot):
+    total, stats, commits = snapshot["total"], snapshot["stats"], snapshot["commits"]
 
     today = datetime.now(timezone.utc).date()
-    cells = []
-    for i in range(365):
-        d = today - timedelta(days=364 - i)
-        c = stats["calendar"].get(d, 0)
-        lvl = "" if c == 0 else "l1" if c < 3 else "l2" if c < 6 else "l3" if c < 10 else "l4"
-        cells.append(lvl)
-
-    return render_template_string(
-        HTML,
+    levels = snapshot_heatmap(snapshot, today - timedelta(days=364), today)
+    cells = [LEVEL_CLASSES[lvl] for lvl in levels]
+
+    return dict(
+        login=snapshot.get("login"),
         total=total,
         total_start=fmt(stats["total_range"][0]),
         total_end=fmt(stats["total_range"][1]),
@@ -286,8 +3021,745 @@ def index():
         commits=commits
     )
 
+
+def render_dashboard(snapshot):
+    return flask.render_template(template("dashboard.html"), **dashboard_context(snapshot))
+
+
+TEAM_BOARDS = (("current", "Current Streak"), ("longest", "Longest Streak"),
+               ("last_year", "Last 365 Days"), ("total", "Total Contributions"))
+
+
+def render_team(snapshot, top=50):
+    return flask.render_template(template("team.html"), team=snapshot["team"], boards=snapshot["boards"],
+                                 missing=snapshot["missing"], boards_shown=TEAM_BOARDS, top=top, fmt=fmt)
+
+
+# ---------------- PAGE CACHE ---------------- #
+
+page_cache = deferred(lambda: TTLCache(maxsize=config.PAGE_CACHE_SIZE, ttl=24 * 3600))
+# API bodies and heatmap images: a poller cycling through queries evicts
+# other queries, not the dashboard pages
+query_cache = deferred(lambda: TTLCache(maxsize=config.QUERY_CACHE_SIZE, ttl=24 * 3600))
+
+
+def page_variants(body, compress=True):
+    # every encoding is compressed once, up front; ETags are strong and
+    # differ per encoding since the bytes differ
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    tag = hashlib.sha256(body).hexdigest()[:32]
+    variants = {"identity": (tag, body)}
+    if compress:
+        variants["gzip"] = (tag + "-gz", gzip.compress(body, 9, mtime=0))
+        if brotli is not None:
+            variants["br"] = (tag + "-br", brotli.compress(body, quality=11))
+    return variants
+
+
+def cached_page(key, render, compress=True, cache=None):
+    cache = page_cache if cache is None else cache
+    variants = cache.get(key)
+    if variants is None:
+        variants = page_variants(render(), compress)
+        cache.set(key, variants)
+    return variants
+
+
+def choose_variant(variants, accepted, if_none_match):
+    # -> (encoding, etag, body, not_modified); accepted / if_none_match are
+    # werkzeug's parsed Accept-Encoding and If-None-Match headers
+    encoding = next((e for e in ("br", "gzip") if e in variants and accepted[e]), "identity")
+    tag, body = variants[encoding]
+    return encoding, tag, body, if_none_match.contains(tag)
+
+
+def page_response(variants, mimetype="text/html"):
+    encoding, tag, body, not_modified = choose_variant(
+        variants, flask.request.accept_encodings, flask.request.if_none_match)
+
+    if not_modified:
+        response = flask.Response(status=304)
+    else:
+        response = flask.Response(body, mimetype=mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(tag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# how the Flask views get the configured user's snapshot; ASGI mode points it
+# at async_refresher, so there is one refresh loop and one snapshot, not two
+_main_snapshot = {"get": None}
+
+
+def main_snapshot():
+    get = _main_snapshot["get"]
+    return refresher.get() if get is None else get()
+
+
+@route("/")
+def index():
+    snapshot = main_snapshot()
+    today = datetime.now(timezone.utc).date()
+    key = ("dashboard", snapshot_digest(snapshot), today)
+    return page_response(cached_page(key, lambda: render_dashboard(snapshot)))
+
+
+@route("/u/<login>")
+def user_dashboard(login):
+    if not LOGIN_RE.fullmatch(login):
+        return flask.jsonify(error="not a GitHub login"), 404
+    try:
+        snapshot = user_snapshot(login)
+    except Exception as e:
+        return flask.jsonify(error=f"could not load {login}: {e!r}"), 502
+    today = datetime.now(timezone.utc).date()
+    key = ("dashboard", snapshot_digest(snapshot), today)
+    return page_response(cached_page(key, lambda: render_dashboard(snapshot)))
+
+
+@route("/team")
+def team_page():
+    if not config.TEAM_LOGINS:
+        return flask.jsonify(error="TEAM_LOGINS is not configured"), 404
+    snapshot = team_refresher.get()
+    return page_response(cached_page(("team", snapshot["digest"]), lambda: render_team(snapshot)))
+
+
+# longest window the heatmap and calendar endpoints will render
+MAX_RANGE_DAYS = 40 * 366
+
+
+def _heatmap_window(args, today):
+    # ?days=365 (default) or ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    end = date.fromisoformat(args["to"]) if "to" in args else today
+    if "from" in args:
+        start = date.fromisoformat(args["from"])
+    else:
+        start = end - timedelta(days=min(int(args.get("days", 365)), MAX_RANGE_DAYS) - 1)
+    if end < start or (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError("bad date range")
+    return start, end
+
+
+@route("/heatmap.svg")
+@route("/heatmap.png")
+def heatmap_image():
+    snapshot = main_snapshot()
+    today = datetime.now(timezone.utc).date()
+    thresholds = flask.request.args.get("thresholds") or config.HEATMAP_THRESHOLDS
+    try:
+        start, end = _heatmap_window(flask.request.args, today)
+        resolve_thresholds(thresholds, [])
+    except ValueError:
+        return flask.jsonify(error="bad date range or thresholds"), 400
+    png = flask.request.path.endswith(".png")
+
+    def render():
+        levels = snapshot_heatmap(snapshot, start, end, thresholds)
+        return render_heatmap_png(levels, start) if png else render_heatmap_svg(levels, start)
+
+    key = (flask.request.path, snapshot_digest(snapshot), start, end, thresholds)
+    return page_response(cached_page(key, render, compress=not png, cache=query_cache),
+                         mimetype="image/png" if png else "image/svg+xml")
+
+
+# ---------------- JSON API ---------------- #
+
+def _json_default(o):
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _fields_param(args):
+    # ?fields= as a cache key: the same set in any order is the same body
+    fields = args.get("fields")
+    return ",".join(sorted(set(fields.split(",")))) if fields else None
+
+
+def _select_fields(data, fields):
+    # ?fields=a,b keeps only those top-level keys
+    if not fields:
+        return data
+    wanted = set(fields.split(","))
+    return {k: v for k, v in data.items() if k in wanted}
+
+
+def _streak(length, bounds):
+    return {"length": length, "start": bounds[0], "end": bounds[1]}
+
+
+def api_stats_payload(snapshot):
+    stats, analytics = snapshot["stats"], snapshot["analytics"]
+    return {
+        "total": snapshot["total"],
+        "total_range": {"start": stats["total_range"][0], "end": stats["total_range"][1]},
+        "current": _streak(stats["current"], stats["current_range"]),
+        "longest": _streak(stats["longest"], stats["longest_range"]),
+        "top_streaks": analytics["top"],
+        "gaps": analytics["gaps"],
+        "active_days": analytics["active_days"],
+        "built_at": snapshot["built_at"],
+    }
+
+
+def api_calendar_payload(calendar, start, end, encoding):
+    """Counts for start..end; dates are implied by start + position.
+
+    encoding=delta (default) sends the first count and then day-to-day
+    differences, which are mostly small numbers and compress well;
+    plain sends the counts; days sends GitHub-style date/count objects.
+    """
+    counts = calendar.window(start, end).tolist()
+    payload = {"start": start, "end": end, "encoding": encoding}
+    if encoding == "delta":
+        payload["counts"] = [b - a for a, b in zip([0] + counts, counts)]
+    elif encoding == "plain":
+        payload["counts"] = counts
+    elif encoding == "days":
+        payload["days"] = [{"date": start + timedelta(days=i), "contributionCount": c}
+                           for i, c in enumerate(counts)]
+    else:
+        raise ValueError(f"unknown encoding {encoding!r}")
+    return payload
+
+
+def _stats_body(args):
+    # -> (the normalised query values the body depends on, build(snapshot));
+    # the Flask views and ASGI mode share these
+    fields = _fields_param(args)
+    return fields, lambda s: _select_fields(api_stats_payload(s), fields)
+
+
+def _calendar_body(args):
+    params = (args.get("from"), args.get("to"), args.get("encoding", "delta"))
+
+    def build(snapshot):
+        calendar = snapshot["stats"]["calendar"]
+        start = date.fromisoformat(params[0]) if params[0] is not None else calendar.base
+        end = date.fromisoformat(params[1]) if params[1] is not None else calendar.end
+        if start is None or end is None or end < start or (end - start).days > MAX_RANGE_DAYS:
+            raise ValueError("bad date range")
+        return api_calendar_payload(calendar, start, end, params[2])
+    return params, build
+
+
+def _commits_body(args):
+    fields = _fields_param(args)
+    return fields, lambda s: _select_fields(s["commits"], fields)
+
+
+def _api_response(body):
+    params, build = body(flask.request.args)
+    snapshot = main_snapshot()
+    key = (flask.request.path, params, snapshot_digest(snapshot))
+    try:
+        variants = cached_page(key, lambda: dumps_json(build(snapshot)), cache=query_cache)
+    except ValueError as e:
+        return flask.jsonify(error=str(e)), 400
+    return page_response(variants, mimetype="application/json")
+
+
+@route("/api/stats")
+def api_stats():
+    return _api_response(_stats_body)
+
+
+@route("/api/calendar")
+def api_calendar():
+    return _api_response(_calendar_body)
+
+
+@route("/api/commits")
+def api_commits():
+    return _api_response(_commits_body)
+
+
+@route("/api/team")
+def api_team():
+    if not config.TEAM_LOGINS:
+        return flask.jsonify(error="TEAM_LOGINS is not configured"), 404
+    snapshot = team_refresher.get()
+    board = flask.request.args.get("board")
+    if board is not None and board not in snapshot["boards"]:
+        return flask.jsonify(error=f"unknown board {board!r}"), 400
+
+    def build():
+        if board is None:
+            return {"members": snapshot["team"], "missing": snapshot["missing"],
+                    "built_at": snapshot["built_at"]}
+        return {"board": board, "rows": snapshot["boards"][board]}
+    variants = cached_page((flask.request.path, board, snapshot["digest"]), lambda: dumps_json(build()),
+                           cache=query_cache)
+    return page_response(variants, mimetype="application/json")
+
+
+@route("/healthz")
+def healthz():
+    health = refresher.health()
+    health["http"] = http_stats()
+    health["http_cache"] = http_cache.info()
+    health["rate_limit"] = rate_budget.info()
+    health["tokens"] = token_pool.info()
+    health["retries"] = retry_budget.info()
+    health["circuits"] = {name: b.info() for name, b in breakers.items()}
+    health["fallbacks"] = fallback_stats()
+    health["commit_cache"] = commit_cache.info()
+    health["page_cache"] = page_cache.info()
+    health["query_cache"] = query_cache.info()
+    health["users"] = users.info()
+    if config.TEAM_LOGINS:
+        health["team"] = dict(team_refresher.health(), members=len(config.TEAM_LOGINS), cache=team_cache.info())
+    return flask.jsonify(health), 503 if health["status"] == "empty" else 200
+
+
+# ---------------- ASYNC (ASGI) MODE ---------------- #
+# Same fetchers, snapshot and pages as the Flask app, but the GitHub calls run
+# on asyncio with httpx, so a slow call parks a coroutine instead of a worker.
+# Run with: uvicorn app_upgrade:asgi_app  (or SERVE_MODE=asgi python app_upgrade.py)
+# Paths without an async handler are passed to the Flask app when asgiref is
+# installed. Those views run on a pool of ASGI_FLASK_WORKERS threads, so a
+# slow one (a first /u/<login> load) only ties up its own thread, and they
+# share async_refresher's snapshot.
+
+async def _async_observe_rate_limit(r):
+    error = _response_error(r)
+    if error is not None:
+        await r.aclose()
+        raise error
+
+
+def async_http_client():
+    import httpx  # optional, only needed in ASGI mode
+
+    return httpx.AsyncClient(
+        headers=config.HEADERS,
+        timeout=15,
+        limits=httpx.Limits(max_connections=config.HTTP_POOL_MAXSIZE,
+                            max_keepalive_connections=config.HTTP_POOL_MAXSIZE),
+        event_hooks={"response": [_async_observe_rate_limit]},
+    )
+
+
+async def async_call_github(endpoint, send, retries=None, split_statuses=()):
+    # call_github() for httpx: same backoff, retry budget and breakers
+    import httpx
+
+    retries = config.FETCH_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        breakers[endpoint].check()
+        try:
+            r = await send()
+        except httpx.TransportError as e:
+            breakers[endpoint].failure()
+            error = e
+        else:
+            error = _call_outcome(endpoint, r, split_statuses)
+            if error is None:
+                return r
+        if attempt == retries or not retry_budget.withdraw():
+            raise error
+        await asyncio.sleep(retry_delay(attempt))
+
+
+async def _async_fetch_window(client, start, end):
+    r = await async_call_github("graphql", lambda: client.post(
+        GRAPHQL_URL, headers=token_pool.acquire("graphql", primary=True),
+        json={"query": CONTRIBUTIONS_QUERY, "variables": {
+            "login": config.GITHUB_USERNAME, "from": start.isoformat(), "to": end.isoformat()}}))
+    return _parse_window(response_json(r))
+
+
+async def _async_fetch_batched(client, windows):
+    limit = batch_limit.get()
+    if limit and len(windows) > limit:
+        parts = await asyncio.gather(*(_async_fetch_batched(client, windows[i:i + limit])
+                                       for i in range(0, len(windows), limit)))
+        return [cal for part in parts for cal in part]
+
+    r = await async_call_github("graphql", lambda: client.post(
+        GRAPHQL_URL, headers=token_pool.acquire("graphql", rate_budget.price("batched"), primary=True),
+        timeout=30, json={"query": build_batched_query(windows), "variables": {"login": config.GITHUB_USERNAME}}),
+        split_statuses=_SPLITTABLE_STATUSES)
+    try:
+        return _parse_batched(r.status_code, functools.partial(response_json, r), windows)
+    except QueryTooLarge as e:
+        if len(windows) == 1:
+            return [await _async_fetch_window(client, *windows[0])]
+        if e.complexity:
+            batch_limit.rejected(len(windows))
+        mid = (len(windows) + 1) // 2
+        left, right = await asyncio.gather(_async_fetch_batched(client, windows[:mid]),
+                                           _async_fetch_batched(client, windows[mid:]))
+        return left + right
+
+
+async def _async_fetch_calendars(client, windows):
+    if config.FETCH_MODE == "batched":
+        return await _async_fetch_batched(client, windows)
+    return list(await asyncio.gather(*(_async_fetch_window(client, *w) for w in windows)))
+
+
+async def async_fetch_contributions(client):
+    store = get_calendar_store()
+    if store is None:
+        return _join_calendars(await _async_fetch_calendars(client, year_windows()))
+
+    # sqlite calls are blocking, so they run in a worker thread
+    import httpx
+
+    login = config.GITHUB_USERNAME
+    if _first_store_read(login):
+        total, calendar = await asyncio.to_thread(store.load_calendar, login)
+        if len(calendar):
+            # same cold start as fetch_contributions(); the task is kept so it isn't collected
+            _async_syncs["task"] = asyncio.ensure_future(_async_background_sync(client, store, login))
+            return total, calendar
+
+    try:
+        await _async_sync(client, store, login)
+    except fallback_errors() + (httpx.TransportError,):
+        total, calendar = await asyncio.to_thread(store.load_calendar, login)
+        if not len(calendar):
+            raise
+        count_fallback("contributions")
+        return total, calendar
+    return await asyncio.to_thread(store.load_calendar, login)
+
+
+async def _async_sync(client, store, login):
+    now = datetime.now(timezone.utc)
+    plan, arg = await asyncio.to_thread(_sync_plan, store, login, now)
+    if plan == "delta":
+        cal = await _async_fetch_window(client, *arg)
+        await asyncio.to_thread(store.save_delta, login, cal["calendar"], now)
+    elif plan == "years":
+        calendars = await _async_fetch_calendars(client, arg)
+        await asyncio.to_thread(store.save_years, login, arg, calendars, now)
+
+
+_async_syncs = {"task": None}
+
+
+async def _async_background_sync(client, store, login):
+    try:
+        await _async_sync(client, store, login)
+    except Exception:
+        pass  # the next refresh syncs (or falls back to the store) again
+
+
+async def _async_repo_commits(client, name, since, until, limit):
+    failed = ("repo_failed", name)
+    if commit_cache.peek(failed) is not None:
+        return []
+    try:
+        async with limit:
+            cr = await async_call_github("commits", lambda: client.get(
+                f"{API_URL}/repos/{name}/commits", timeout=config.COMMIT_TIMEOUT,
+                headers=token_pool.acquire("core", primary=True),
+                params={"since": since, "until": until, "per_page": 20}))
+        return response_json(cr)
+    except CircuitOpen:
+        return []  # GitHub's problem, not the repo's; the breaker check after the scan catches it
+    except (RateLimited, BadToken):
+        raise  # the scan can't finish; async_fetch_recent_commits() keeps the last rows
+    except Exception as e:
+        commit_cache.set_negative(failed, e, config.REPO_NEGATIVE_TTL)
+        return []
+
+
+async def _async_recent_commits(client, backend, since, until):
+    if backend == "graphql":
+        r = await async_call_github("graphql", lambda: client.post(
+            GRAPHQL_URL, headers=token_pool.acquire("graphql", primary=True),
+            json={"query": RECENT_COMMITS_QUERY, "variables": {"since": since, "until": until}}))
+        return _parse_recent_commits(response_json(r))
+
+    r = await async_call_github("repos", lambda: client.get(
+        f"{API_URL}/user/repos", headers=token_pool.acquire("core", primary=True),
+        params={"per_page": 50, "sort": "pushed"}))
+    names = [repo["full_name"] for repo in response_json(r)]
+    limit = asyncio.Semaphore(max(config.COMMIT_WORKERS, 1))
+    tasks = [asyncio.ensure_future(_async_repo_commits(client, n, since, until, limit))
+             for n in names]
+    done, pending = await asyncio.wait(tasks, timeout=config.COMMIT_BATCH_TIMEOUT)
+    for t in pending:
+        t.cancel()
+    breakers["commits"].check()
+    return [(c["commit"]["author"]["date"], c["commit"]["message"])
+            for t in tasks if t in done for c in t.result()]
+
+
+async def async_fetch_recent_commits(client, backend=None):
+    backend = backend or config.COMMITS_BACKEND
+    key = ("recent_commits", backend)
+    rows = commit_cache.get(key)
+    if rows is not None:
+        return rows
+
+    today, yesterday, since, until = _commit_window()
+    resource, planned = ("graphql", 1) if backend == "graphql" else ("core", 51)
+    if not token_pool.allows(resource, planned, low_priority=True, primary=True):
+        rate_budget.count("deferred")
+        return commit_cache.get(("last_rows",) + key) or {"today": [], "yesterday": []}
+
+    import httpx
+
+    try:
+        commits = await _async_recent_commits(client, backend, since, until)
+    except fallback_errors() + (httpx.TransportError,):
+        count_fallback("commits")
+        return commit_cache.get(("last_rows",) + key) or {"today": [], "yesterday": []}
+
+    rows = _commit_rows(commits, today, yesterday)
+    commit_cache.set(key, rows, config.COMMIT_CACHE_TTL)
+    commit_cache.set(("last_rows",) + key, rows, 24 * 3600)
+    return rows
+
+
+async def async_build_snapshot(client):
+    (total, calendar), commits = await asyncio.gather(async_fetch_contributions(client),
+                                                      async_fetch_recent_commits(client))
+    return assemble_snapshot(total, calendar, commits)
+
+
+class AsyncSnapshotRefresher(SnapshotRefresher):
+    """SnapshotRefresher on the event loop: same stale-while-revalidate and
+    single-flight rules, with an asyncio.Lock and tasks instead of threads."""
+
+    def __init__(self, interval):
+        super().__init__(None, interval, background=True)
+        self._refresh_lock = asyncio.Lock()
+        self.client = None
+
+    async def refresh(self, wait=False):
+        if self._refresh_lock.locked() and not wait:
+            return False
+        async with self._refresh_lock:
+            if self.snapshot is not None and self.age() < self.interval:
+                return True
+            if self.client is None:
+                self.client = async_http_client()
+            try:
+                snapshot = await async_build_snapshot(self.client)
+            except Exception as e:
+                self.last_error = repr(e)
+                self.failures += 1
+                if self.snapshot is None:
+                    raise
+                return False
+            self.snapshot = snapshot
+            self.last_error = None
+            return True
+
+    async def get(self):
+        if self.snapshot is None:
+            await self.refresh(wait=True)
+        elif self.age() >= self.interval and not self.refreshing():
+            self._kick = asyncio.ensure_future(self.refresh())
+        return self.snapshot
+
+    async def run(self):
+        # periodic refresh, started from the ASGI lifespan
+        while True:
+            try:
+                await self.refresh(wait=True)
+            except Exception:
+                pass  # recorded in last_error, retried next tick
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+async_refresher = deferred(lambda: AsyncSnapshotRefresher(config.REFRESH_INTERVAL))
+
+
+def _asgi_request_headers(scope):
+    from werkzeug.datastructures import Headers
+    return Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+
+
+def _asgi_page(scope, variants, mimetype):
+    from werkzeug.http import parse_accept_header, parse_etags
+
+    headers = _asgi_request_headers(scope)
+    encoding, tag, body, not_modified = choose_variant(
+        variants, parse_accept_header(headers.get("Accept-Encoding")),
+        parse_etags(headers.get("If-None-Match")))
+
+    out = [("etag", f'"{tag}"'), ("vary", "Accept-Encoding"), ("cache-control", "no-cache")]
+    if not_modified:
+        return 304, out, b""
+    if encoding != "identity":
+        out.append(("content-encoding", encoding))
+    out.append(("content-type", mimetype + ("; charset=utf-8" if mimetype.startswith("text/") else "")))
+    return 200, out, body
+
+
+async def _asgi_index(scope):
+    snapshot = await async_refresher.get()
+    today = datetime.now(timezone.utc).date()
+    key = ("dashboard", snapshot_digest(snapshot), today)
+    variants = cached_page(key, lambda: template("dashboard.html").render(**dashboard_context(snapshot)))
+    return _asgi_page(scope, variants, "text/html")
+
+
+async def _asgi_api(scope, body):
+    # _api_response() for ASGI: same bodies, same cache entries
+    from urllib.parse import parse_qsl
+    from werkzeug.datastructures import MultiDict
+
+    params, build = body(MultiDict(parse_qsl(scope["query_string"].decode("latin-1"))))
+    snapshot = await async_refresher.get()
+    key = (scope["path"], params, snapshot_digest(snapshot))
+    try:
+        variants = cached_page(key, lambda: dumps_json(build(snapshot)), cache=query_cache)
+    except ValueError as e:
+        return 400, [("content-type", "application/json")], dumps_json({"error": str(e)})
+    return _asgi_page(scope, variants, "application/json")
+
+
+async def _asgi_healthz(scope):
+    health = async_refresher.health()
+    health["http_cache"] = http_cache.info()
+    health["rate_limit"] = rate_budget.info()
+    health["tokens"] = token_pool.info()
+    health["retries"] = retry_budget.info()
+    health["circuits"] = {name: b.info() for name, b in breakers.items()}
+    health["fallbacks"] = fallback_stats()
+    health["commit_cache"] = commit_cache.info()
+    health["page_cache"] = page_cache.info()
+    health["query_cache"] = query_cache.info()
+    status = 503 if health["status"] == "empty" else 200
+    return status, [("content-type", "application/json")], dumps_json(health)
+
+
+ASGI_ROUTES = {
+    "/": _asgi_index,
+    "/healthz": _asgi_healthz,
+    "/api/stats": lambda scope: _asgi_api(scope, _stats_body),
+    "/api/calendar": lambda scope: _asgi_api(scope, _calendar_body),
+    "/api/commits": lambda scope: _asgi_api(scope, _commits_body),
+}
+
+
+class _PooledWsgi:
+    """Serves the Flask app over ASGI, one pool thread per request.
+
+    asgiref's WsgiToAsgi runs every request on a single shared thread, so a
+    view waiting on GitHub (a first /u/<login> load) would hold up every
+    other fallback path. Here each view runs on its own pool thread, builds
+    its whole body there, and the event loop sends it.
+    """
+
+    def __init__(self, app, workers=None):
+        self.app = app
+        self.pool = futures.ThreadPoolExecutor(
+            max_workers=config.ASGI_FLASK_WORKERS if workers is None else workers,
+            thread_name_prefix="asgi-flask")
+
+    async def __call__(self, scope, receive, send):
+        from io import BytesIO
+        from asgiref.wsgi import WsgiToAsgiInstance
+
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        # asgiref's environ and start_response, without its thread
+        instance = WsgiToAsgiInstance(self.app)
+        instance.scope = scope
+        try:
+            environ = instance.build_environ(scope, BytesIO(b"".join(chunks)))
+        except ValueError:  # too many duplicate headers
+            await send({"type": "http.response.start", "status": 400,
+                        "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": b"Bad Request"})
+            return
+        body = await asyncio.get_running_loop().run_in_executor(self.pool, self._run, instance, environ)
+        await send(instance.response_start)
+        await send({"type": "http.response.body", "body": body})
+
+    def _run(self, instance, environ):
+        result = self.app(environ, instance.start_response)
+        try:
+            return b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+def _flask_fallback():
+    if importlib.util.find_spec("asgiref") is None:
+        return None
+    # the Flask views (heatmaps, /u/<own login>) read async_refresher's
+    # snapshot, awaited on this loop, instead of starting the threaded refresher
+    loop = asyncio.get_running_loop()
+    _main_snapshot["get"] = lambda: asyncio.run_coroutine_threadsafe(async_refresher.get(), loop).result()
+    return _PooledWsgi(get_app())
+
+
+_asgi_flask = {"app": None, "loaded": False}
+
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        task = None
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if config.BACKGROUND_REFRESH:
+                    task = asyncio.ensure_future(async_refresher.run())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if task is not None:
+                    task.cancel()
+                await async_refresher.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    handler = ASGI_ROUTES.get(scope["path"])
+    if handler is None:
+        if not _asgi_flask["loaded"]:
+            _asgi_flask["app"], _asgi_flask["loaded"] = _flask_fallback(), True
+        if _asgi_flask["app"] is not None:
+            return await _asgi_flask["app"](scope, receive, send)
+        status, headers, body = 404, [("content-type", "text/plain")], b"Not Found"
+    else:
+        try:
+            status, headers, body = await handler(scope)
+        except Exception as e:
+            status, headers, body = 502, [("content-type", "text/plain")], repr(e).encode()
+
+    headers = headers + [("content-length", str(len(body)))]
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    if config.SERVE_MODE == "asgi":
+        import uvicorn
+        uvicorn.run(asgi_app, host="127.0.0.1", port=int(os.getenv("PORT", "5000")))
+    else:
+        get_app().run(debug=True)
 
 
 
@@ -0,0 +1,1315 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for app_upgrade.py against a local stub GitHub API.
+
+Usage:
+    python bench_app_upgrade.py fetch [--latency 0.2] [--workers 1 4 8 18] [--max-windows N]
+    python bench_app_upgrade.py store [--latency 0.2]
+    python bench_app_upgrade.py commits [--latency 0.1] [--repos 50] [--workers 4 8 16]
+    python bench_app_upgrade.py http [--calls 200]
+    python bench_app_upgrade.py conditional [--latency 0.02]
+    python bench_app_upgrade.py streaks [--cases 2000] [--seed 1] [--no-numpy]
+    python bench_app_upgrade.py calendar [--years 18]
+    python bench_app_upgrade.py render [--requests 300]
+    python bench_app_upgrade.py page [--requests 500]
+    python bench_app_upgrade.py heatmap
+    python bench_app_upgrade.py heatmap-image [--requests 300]
+    python bench_app_upgrade.py api [--requests 300]
+    python bench_app_upgrade.py load [--latency 0.2] [--interval 1] [--concurrency 32] [--cold]
+    python bench_app_upgrade.py users [--users 200] [--seconds 10] [--per-minute 600] [--sync-interval 0]
+    python bench_app_upgrade.py team [--members 200] [--latency 0.1]
+    python bench_app_upgrade.py ratelimit [--core 200] [--graphql 40] [--rounds 30]
+    python bench_app_upgrade.py tokens [--users 300] [--graphql 50] [--tokens 1 2 4]
+    python bench_app_upgrade.py flaky [--fail-rate 0.2] [--rounds 40] [--outage-latency 0.3] [--gateway-fetches 6]
+    python bench_app_upgrade.py startup [--runs 5]
+    python bench_app_upgrade.py stream [--members 200] [--workers 6]
+"""
+
+import argparse
+import gc
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+os.environ.setdefault("GITHUB_USERNAME", "bench-user")
+os.environ.setdefault("GITHUB_TOKEN", "bench-token")
+
+import app_upgrade  # noqa: E402
+from test_app_upgrade import check_streak_properties, random_days, reference_stats  # noqa: E402
+
+
+# ---------------- STUB GITHUB ---------------- #
+
+def fake_count(d):
+    # deterministic pseudo-random contribution count for a day
+    h = (d.toordinal() * 2654435761) & 0xFFFFFFFF
+    return 0 if h % 5 == 0 else h % 13
+
+
+def fake_calendar(start, end):
+    days = []
+    d = start
+    while d <= end:
+        days.append({"date": d.isoformat(), "contributionCount": fake_count(d)})
+        d += timedelta(days=1)
+    weeks = [{"contributionDays": days[i:i + 7]} for i in range(0, len(days), 7)]
+    return {"totalContributions": sum(x["contributionCount"] for x in days), "weeks": weeks}
+
+
+def _day(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+
+
+ALIAS_RE = re.compile(r'(\w+): contributionsCollection\(from: "([^"]+)", to: "([^"]+)"\)')
+USER_ALIAS_RE = re.compile(r'(u\d+): user\(login: "([^"]+)"\)')
+
+
+def fake_commits(repo, since, until):
+    # a few commits per repo spread over yesterday and today
+    start = datetime.fromisoformat(since)
+    seed = sum(map(ord, repo))
+    commits = []
+    for i in range(seed % 4):
+        ts = start + timedelta(hours=(seed * (i + 3)) % 48, minutes=(seed * (i + 7)) % 60)
+        commits.append({"commit": {"author": {"date": ts.strftime("%Y-%m-%dT%H:%M:%SZ")},
+                                   "message": f"{repo}: change {i}"}})
+    return commits
+
+
+class StubGitHub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+    disable_nagle_algorithm = True
+    latency = 0.0
+    max_windows = 0         # reject aliased queries larger than this (0 = no limit)
+    repos = 50
+    slow_repo = None        # this repo hangs for slow_latency seconds
+    slow_latency = 0.0
+    requests_served = 0
+    not_modified = 0
+    rate_limits = {}        # resource -> requests per rate_window and token (missing = 5000, never hit)
+    rate_window = 60.0
+    rate_used = {}          # (token, resource) -> requests this window
+    rate_reset = 0.0
+    throttled = 0
+    fail_rate = 0.0         # share of requests answered with fail_status
+    fail_status = 503
+    failed = 0
+    rng = random.Random(1)
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _rate_limit(self, resource):
+        # GitHub-style X-RateLimit-* headers per token; False (after sending a
+        # 403) once spent, or a 401 for tokens starting with "bad"
+        token = self.headers.get("Authorization", "").split(" ")[-1]
+        if token.startswith("bad"):
+            self._send(401, {"message": "Bad credentials"})
+            return False
+        with StubGitHub.lock:
+            now = time.time()
+            if now >= StubGitHub.rate_reset:
+                StubGitHub.rate_used, StubGitHub.rate_reset = {}, now + StubGitHub.rate_window
+            limit = StubGitHub.rate_limits.get(resource, 5000)
+            used = StubGitHub.rate_used.get((token, resource), 0)
+            allowed = used < limit
+            if allowed:
+                used = StubGitHub.rate_used[(token, resource)] = used + 1
+            else:
+                StubGitHub.throttled += 1
+            self.rate_headers = {"X-RateLimit-Limit": limit, "X-RateLimit-Remaining": max(limit - used, 0),
+                                 "X-RateLimit-Reset": int(StubGitHub.rate_reset) + 1,
+                                 "X-RateLimit-Used": used, "X-RateLimit-Resource": resource}
+        if not allowed:
+            self._send(403, {"message": "API rate limit exceeded"})
+        return allowed
+
+    def _flaky(self):
+        # True (after sending a 5xx) for a fail_rate share of requests
+        with StubGitHub.lock:
+            failing = StubGitHub.fail_rate > 0 and StubGitHub.rng.random() < StubGitHub.fail_rate
+            StubGitHub.failed += failing
+        if failing:
+            time.sleep(self.latency)
+            self._send(self.fail_status, {"message": "Server Error"})
+        return failing
+
+    def _send(self, status, payload, etag=False):
+        body = json.dumps(payload).encode()
+        tag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if etag and self.headers.get("If-None-Match") == tag:
+            with StubGitHub.lock:
+                StubGitHub.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in getattr(self, "rate_headers", {}).items():
+            self.send_header(k, str(v))
+        if etag:
+            self.send_header("ETag", tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with StubGitHub.lock:
+            StubGitHub.requests_served += 1
+        if not self._rate_limit("core") or self._flaky():
+            return
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+
+        m = re.fullmatch(r"/user/repos|/users/([^/]+)/repos", url.path)
+        if m:
+            owner = m.group(1) or "bench-user"
+            time.sleep(self.latency)
+            self._send(200, [{"full_name": f"{owner}/repo{i}"} for i in range(self.repos)], etag=True)
+            return
+
+        m = re.fullmatch(r"/repos/([^/]+/[^/]+)/commits", url.path)
+        if m:
+            repo = m.group(1)
+            time.sleep(self.slow_latency if repo == self.slow_repo else self.latency)
+            self._send(200, fake_commits(repo, query["since"], query["until"]), etag=True)
+            return
+
+        self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        with StubGitHub.lock:
+            StubGitHub.requests_served += 1
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if not self._rate_limit("graphql") or self._flaky():
+            return
+        time.sleep(self.latency)
+        v = payload.get("variables") or {}
+
+        if "history(" in payload["query"]:
+            owner = "viewer" if "viewer" in payload["query"] else "user"
+            nodes = []
+            for i in range(self.repos):
+                repo = f"{v.get('login', 'bench-user')}/repo{i}"
+                history = [{"authoredDate": c["commit"]["author"]["date"], "message": c["commit"]["message"]}
+                           for c in fake_commits(repo, v["since"], v["until"])]
+                nodes.append({"nameWithOwner": repo,
+                              "defaultBranchRef": {"target": {"history": {"nodes": history}}}})
+            self._send(200, {"data": {owner: {"repositories": {"nodes": nodes}}}})
+            return
+
+        users = list(USER_ALIAS_RE.finditer(payload["query"]))
+        if users:
+            # team query: logins starting with "ghost" don't exist
+            windows = len(ALIAS_RE.findall(payload["query"]))
+            if self.max_windows and windows > self.max_windows:
+                self._send(200, {"errors": [{"type": "MAX_NODE_LIMIT_EXCEEDED",
+                                             "message": "query complexity too high"}]})
+                return
+            data, errors = {}, []
+            for m, nxt in zip(users, users[1:] + [None]):
+                alias, login = m.group(1), m.group(2)
+                if login.startswith("ghost"):
+                    data[alias] = None
+                    errors.append({"type": "NOT_FOUND", "path": [alias],
+                                   "message": f"Could not resolve to a User with the login of '{login}'."})
+                    continue
+                block = payload["query"][m.end():nxt.start() if nxt else None]
+                data[alias] = {a: {"contributionCalendar": fake_calendar(_day(f), _day(t))}
+                               for a, f, t in ALIAS_RE.findall(block)}
+            self._send(200, dict({"data": data}, **({"errors": errors} if errors else {})))
+            return
+
+        aliases = ALIAS_RE.findall(payload["query"])
+        if aliases:
+            if self.max_windows and len(aliases) > self.max_windows:
+                self._send(200, {"errors": [{"type": "MAX_NODE_LIMIT_EXCEEDED",
+                                             "message": "query complexity too high"}]})
+                return
+            user = {alias: {"contributionCalendar": fake_calendar(_day(f), _day(t))}
+                    for alias, f, t in aliases}
+            self._send(200, {"data": {"user": user}})
+            return
+
+        cal = fake_calendar(_day(v["from"]), _day(v["to"]))
+        self._send(200, {"data": {"user": {"contributionsCollection": {"contributionCalendar": cal}}}})
+
+
+def start_stub(latency, max_windows=0):
+    StubGitHub.latency = latency
+    StubGitHub.max_windows = max_windows
+    StubGitHub.requests_served = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGitHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    app_upgrade.API_URL = base
+    app_upgrade.GRAPHQL_URL = base + "/graphql"
+    return server, base
+
+
+# ---------------- BENCHMARKS ---------------- #
+
+def bench_fetch(args):
+    server, _ = start_stub(args.latency, args.max_windows)
+    print(f"stub latency {args.latency * 1000:.0f} ms, "
+          f"{len(app_upgrade.year_windows())} year windows")
+
+    runs = [("concurrent", w) for w in args.workers] + [("batched", 1)]
+    baseline = None
+    for mode, workers in runs:
+        StubGitHub.requests_served = 0
+        t0 = time.perf_counter()
+        result = app_upgrade.fetch_contributions_remote(workers=workers, mode=mode)
+        elapsed = time.perf_counter() - t0
+        if baseline is None:
+            baseline = result
+        same = "ok" if result == baseline else "MISMATCH"
+        label = f"{mode} workers={workers}" if mode == "concurrent" else mode
+        print(f"{label:<24} {elapsed * 1000:8.1f} ms  "
+              f"requests={StubGitHub.requests_served:<3} result={same}")
+    server.shutdown()
+
+
+def bench_store(args):
+    server, _ = start_stub(args.latency)
+    remote = app_upgrade.fetch_contributions_remote()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = app_upgrade.CalendarStore(os.path.join(tmp, "bench.db"))
+        app_upgrade.config.STORE_SYNC_INTERVAL = 0
+
+        steps = [
+            ("first sync (empty store)", lambda: app_upgrade.sync_contributions(store)),
+            ("delta sync", lambda: app_upgrade.sync_contributions(store)),
+            ("cold load (disk only)", lambda: app_upgrade.load_contributions(store)),
+        ]
+        for label, step in steps:
+            StubGitHub.requests_served = 0
+            t0 = time.perf_counter()
+            result = step()
+            elapsed = time.perf_counter() - t0
+            same = "ok" if result == remote else "MISMATCH"
+            print(f"{label:<26} {elapsed * 1000:8.1f} ms  "
+                  f"requests={StubGitHub.requests_served:<3} result={same}")
+    server.shutdown()
+
+
+def bench_commits(args):
+    server, _ = start_stub(args.latency)
+    StubGitHub.repos = args.repos
+    print(f"stub latency {args.latency * 1000:.0f} ms, {args.repos} repos")
+
+    def run(label, workers, backend="rest"):
+        app_upgrade.commit_cache.clear()
+        StubGitHub.requests_served = 0
+        t0 = time.perf_counter()
+        rows = app_upgrade.fetch_recent_commits(workers=workers, backend=backend)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<28} {elapsed * 1000:8.1f} ms  requests={StubGitHub.requests_served:<3} "
+              f"today={len(rows['today'])} yesterday={len(rows['yesterday'])}")
+        return rows
+
+    baseline = run("serial", 1)
+    for workers in args.workers:
+        rows = run(f"fan-out workers={workers}", workers)
+        if rows != baseline:
+            print("  MISMATCH against serial rows")
+
+    if run("graphql backend", 1, backend="graphql") != baseline:
+        print("  MISMATCH against serial rows")
+
+    # one hanging repo must not hold the batch past COMMIT_BATCH_TIMEOUT
+    StubGitHub.slow_repo, StubGitHub.slow_latency = "bench-user/repo0", 3.0
+    app_upgrade.config.COMMIT_BATCH_TIMEOUT = 1.0
+    run("fan-out, one repo hangs 3s", max(args.workers))
+    server.shutdown()
+
+
+def bench_http(args):
+    import requests
+
+    server, base = start_stub(0.0)
+    url = base + "/user/repos"
+
+    t0 = time.perf_counter()
+    for _ in range(args.calls):
+        requests.get(url, timeout=5)
+    fresh = time.perf_counter() - t0
+
+    before = app_upgrade.http_stats()
+    t0 = time.perf_counter()
+    for _ in range(args.calls):
+        app_upgrade.http_session().get(url, timeout=5)
+    pooled = time.perf_counter() - t0
+    after = app_upgrade.http_stats()
+
+    print(f"{args.calls} sequential GETs (plain HTTP, no TLS handshake to save)")
+    print(f"requests.get per call   {fresh * 1000:8.1f} ms  connections={args.calls}")
+    print(f"shared session          {pooled * 1000:8.1f} ms  "
+          f"connections={after['connections'] - before['connections']} "
+          f"reused={after['reused'] - before['reused']}")
+    server.shutdown()
+
+
+def bench_conditional(args):
+    server, _ = start_stub(args.latency)
+    print(f"stub latency {args.latency * 1000:.0f} ms, {StubGitHub.repos} repos")
+
+    for label in ("cold cache", "warm cache (304s)"):
+        app_upgrade.commit_cache.clear()
+        StubGitHub.requests_served = StubGitHub.not_modified = 0
+        t0 = time.perf_counter()
+        app_upgrade.fetch_recent_commits(backend="rest")
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<20} {elapsed * 1000:8.1f} ms  requests={StubGitHub.requests_served:<3} "
+              f"304s={StubGitHub.not_modified}")
+    print("cache:", app_upgrade.http_cache.info())
+    server.shutdown()
+
+
+
+
+def bench_streaks(args):
+    if args.no_numpy:
+        app_upgrade.np = None
+    print("numpy path" if app_upgrade.np is not None else "pure-Python path")
+
+    rng = random.Random(args.seed)
+    ok = check_streak_properties(rng, args.cases)
+    print(f"{args.cases} random calendars: {'all identical' if ok else 'MISMATCHES'}")
+
+    # timing: 18 years of history, one new day per refresh
+    days = random_days(rng, 18 * 365)
+    today = date.fromisoformat(days[-1]["date"])
+    t0 = time.perf_counter()
+    for _ in range(20):
+        reference_stats(days, today)
+    full = (time.perf_counter() - t0) / 20
+
+    engine = app_upgrade.StreakEngine()
+    engine.update(days[:-20])
+    t0 = time.perf_counter()
+    for i in range(20, 0, -1):
+        engine.update(days[:len(days) - i + 1])
+        engine.stats(today)
+    incremental = (time.perf_counter() - t0) / 20
+    calendar = app_upgrade.ContributionCalendar.from_days(days)
+
+    # the same refreshes as store.load_calendar() hands them over
+    engine = app_upgrade.StreakEngine()
+    engine.update(app_upgrade.ContributionCalendar(calendar.base, calendar.counts[:-20]))
+    t0 = time.perf_counter()
+    for i in range(20, 0, -1):
+        engine.update(app_upgrade.ContributionCalendar(calendar.base, calendar.counts[:len(days) - i + 1]))
+        engine.stats(today)
+    from_calendar = (time.perf_counter() - t0) / 20
+    _, vectorized, _ = measure(lambda: app_upgrade.streak_analytics(calendar, today))
+    print(f"full recompute {full * 1000:7.2f} ms   incremental update {incremental * 1000:7.2f} ms   "
+          f"from calendars {from_calendar * 1000:7.2f} ms ({len(days)} days, rebuilds={engine.rebuilds})")
+    print(f"streak_analytics (all runs, top-N, gaps) {vectorized * 1000:7.2f} ms")
+    if not ok:
+        raise SystemExit(1)
+
+
+def measure(fn, repeat=20):
+    # (result, seconds per call, peak bytes allocated by one call)
+    result = fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - t0) / repeat
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_calendar(args):
+    rng = random.Random(args.seed)
+    days = random_days(rng, args.years * 365)
+    today = date.fromisoformat(days[-1]["date"])
+    print(f"{len(days)} days")
+
+    def dict_build():
+        return {datetime.strptime(d["date"], "%Y-%m-%d").date(): d["contributionCount"] for d in days}
+
+    def heat_dict(cal):
+        return [cal.get(today - timedelta(days=364 - i), 0) for i in range(365)]
+
+    d, t_dict, m_dict = measure(dict_build)
+    c, t_cal, m_cal = measure(lambda: app_upgrade.ContributionCalendar.from_days(days))
+    print(f"build   dict {t_dict * 1000:7.2f} ms {m_dict / 1024:8.1f} KiB   "
+          f"compact {t_cal * 1000:7.2f} ms {m_cal / 1024:8.1f} KiB (array {c.nbytes / 1024:.1f} KiB)")
+
+    _, t_dict, _ = measure(lambda: heat_dict(d))
+    _, t_cal, _ = measure(lambda: c.window(today - timedelta(days=364), today))
+    print(f"365-day window   dict {t_dict * 1000:7.3f} ms   compact {t_cal * 1000:7.3f} ms")
+
+    _, t_dict, m_dict = measure(lambda: reference_stats(days, today))
+    _, t_cal, m_cal = measure(lambda: app_upgrade.calculate_stats(c))
+    print(f"stats   dict {t_dict * 1000:7.2f} ms {m_dict / 1024:8.1f} KiB   "
+          f"compact {t_cal * 1000:7.2f} ms {m_cal / 1024:8.1f} KiB")
+
+
+def fake_snapshot(rng, years=18):
+    days = random_days(rng, years * 365)
+    stats = app_upgrade.calculate_stats(days)
+    rows = [{"date": "01 Jan 2026", "time": f"{h:02d}:15 PM", "msg": f"commit message number {h}"}
+            for h in range(1, 13)]
+    return {"total": sum(d["contributionCount"] for d in days), "stats": stats,
+            "analytics": app_upgrade.streak_analytics(stats["calendar"]),
+            "commits": {"today": rows[:6], "yesterday": rows[6:]}}
+
+
+def install_snapshot(snapshot):
+    # serve this snapshot from the refresher without any fetching
+    snapshot = dict(snapshot, built_mono=time.monotonic(), built_at=datetime.now())
+    snapshot["digest"] = app_upgrade.snapshot_digest(snapshot)
+    app_upgrade.refresher.background = False
+    app_upgrade.refresher.snapshot = snapshot
+    return snapshot
+
+
+def inlined_dashboard():
+    # the single-string template index() used to pass to render_template_string()
+    html = app_upgrade.HTML.replace('{% include "stat_cards.html" %}', app_upgrade.STAT_CARDS_HTML)
+    html = html.replace('{% include "heatmap.html" %}', app_upgrade.HEATMAP_HTML)
+    for which in ("yesterday", "today"):
+        html = html.replace(
+            '{% with rows = commits.' + which + ' %}{% include "commit_table.html" %}{% endwith %}',
+            app_upgrade.COMMIT_TABLE_HTML.replace("in rows", "in commits." + which))
+    return html
+
+
+def bench_render(args):
+    from flask import render_template, render_template_string
+
+    snapshot = fake_snapshot(random.Random(args.seed))
+    context = app_upgrade.dashboard_context(snapshot)
+    html = inlined_dashboard()
+    app = app_upgrade.app
+
+    with app.test_request_context("/"):
+        before = render_template_string(html, **context)
+        after = render_template(app_upgrade.template("dashboard.html"), **context)
+        same = "".join(before.split()) == "".join(after.split())
+
+        runs = (("render_template_string", lambda: render_template_string(html, **context)),
+                ("precompiled template", lambda: render_template(app_upgrade.template("dashboard.html"), **context)))
+        for label, fn in runs:
+            t0 = time.perf_counter()
+            for _ in range(args.requests):
+                fn()
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<24} {args.requests / elapsed:8.0f} renders/s")
+    print(f"output identical (ignoring whitespace): {same}")
+
+    install_snapshot(snapshot)
+    client = app.test_client()
+    t0 = time.perf_counter()
+    for _ in range(args.requests):
+        client.get("/")
+    elapsed = time.perf_counter() - t0
+    print(f"{'GET / (test client)':<24} {args.requests / elapsed:8.0f} req/s")
+
+
+def bench_page(args):
+    snapshot = fake_snapshot(random.Random(args.seed))
+    install_snapshot(snapshot)
+    client = app_upgrade.app.test_client()
+
+    def run(label, headers, clear=False):
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            if clear:
+                app_upgrade.page_cache.clear()
+            r = client.get("/", headers=headers)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<28} {args.requests / elapsed:8.0f} req/s  status={r.status_code} "
+              f"bytes={len(r.data):<6} encoding={r.headers.get('Content-Encoding', 'identity')}")
+        return r
+
+    run("render every request", {}, clear=True)
+    r = run("cached, identity", {})
+    run("cached, gzip", {"Accept-Encoding": "gzip"})
+    if app_upgrade.brotli is not None:
+        run("cached, br", {"Accept-Encoding": "br, gzip"})
+    run("If-None-Match (304)", {"If-None-Match": r.headers["ETag"]})
+
+    # a poller walking through API and heatmap queries must not push the page out
+    for i in range(200):
+        client.get(f"/api/calendar?from=2020-01-01&to=2020-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+        client.get(f"/heatmap.svg?days={i + 1}")
+    misses = app_upgrade.page_cache.info()["misses"]
+    run("cached, after 400 queries", {})
+    print(f"page still cached after the queries: {app_upgrade.page_cache.info()['misses'] == misses}")
+    print("page cache:", app_upgrade.page_cache.info())
+    print("query cache:", app_upgrade.query_cache.info())
+
+
+def bench_heatmap(args):
+    days = random_days(random.Random(args.seed), 18 * 365)
+    calendar = app_upgrade.ContributionCalendar.from_days(days)
+    lookup = {date.fromisoformat(d["date"]): d["contributionCount"] for d in days}
+    end = calendar.end
+
+    def old_loop(n):
+        # the per-day loop index() used to run
+        cells = []
+        for i in range(n):
+            c = lookup.get(end - timedelta(days=n - 1 - i), 0)
+            cells.append("" if c == 0 else "l1" if c < 3 else "l2" if c < 6 else "l3" if c < 10 else "l4")
+        return cells
+
+    def pure_python(fn):
+        np, app_upgrade.np = app_upgrade.np, None
+        try:
+            return fn()
+        finally:
+            app_upgrade.np = np
+
+    for n in (365, 5 * 365, 18 * 365):
+        start = end - timedelta(days=n - 1)
+        old, t_old, _ = measure(lambda: old_loop(n))
+        new, t_new, _ = measure(lambda: app_upgrade.heatmap_levels(calendar, start, end, "fixed"))
+        quartile, t_q, _ = measure(lambda: app_upgrade.heatmap_levels(calendar, start, end, "quartile"))
+        same = old == [app_upgrade.LEVEL_CLASSES[x] for x in new] and all(
+            pure_python(lambda: app_upgrade.heatmap_levels(calendar, start, end, mode)) == levels
+            for mode, levels in (("fixed", new), ("quartile", quartile)))
+        print(f"{n:>5} days  loop {t_old * 1000:7.3f} ms   levels {t_new * 1000:7.3f} ms   "
+              f"quartile {t_q * 1000:7.3f} ms   identical={same}")
+
+    # quartile bounds with and without NumPy, on random (often sparse) windows
+    rng = random.Random(args.seed)
+    windows = [random_days(rng, rng.randint(1, 400)) for _ in range(200)]
+    windows = [[d["contributionCount"] if rng.random() < 0.2 else 0 for d in w] for w in windows] + \
+              [[d["contributionCount"] for d in w] for w in windows]
+    differ = sum(app_upgrade.quartile_thresholds(w) != pure_python(lambda: app_upgrade.quartile_thresholds(w))
+                 for w in windows)
+    print(f"quartile thresholds, NumPy vs pure Python: {len(windows) - differ}/{len(windows)} windows identical")
+    print("quartile thresholds (last year):",
+          app_upgrade.quartile_thresholds(calendar.window(end - timedelta(days=364), end)))
+
+
+def bench_heatmap_image(args):
+    from flask import render_template
+
+    snapshot = install_snapshot(fake_snapshot(random.Random(args.seed)))
+    app = app_upgrade.app
+    calendar = snapshot["stats"]["calendar"]
+    end = calendar.end
+
+    for n in (365, 5 * 365):
+        start = end - timedelta(days=n - 1)
+        levels = app_upgrade.heatmap_levels(calendar, start, end)
+        cells = [app_upgrade.LEVEL_CLASSES[x] for x in levels]
+        with app.test_request_context("/"):
+            grid, t_grid, _ = measure(lambda: render_template("heatmap.html", cells=cells))
+        svg, t_svg, _ = measure(lambda: app_upgrade.render_heatmap_svg(levels, start))
+        png, t_png, _ = measure(lambda: app_upgrade.render_heatmap_png(levels, start), repeat=5)
+        print(f"{n:>5} days  div grid {len(grid):>7} B {t_grid * 1000:6.2f} ms   "
+              f"svg {len(svg):>7} B {t_svg * 1000:6.2f} ms   png {len(png):>6} B {t_png * 1000:6.2f} ms")
+        print(f"{'':>11}gzip: div grid {len(gzip.compress(grid.encode())):>6} B   "
+              f"svg {len(gzip.compress(svg.encode())):>6} B")
+
+    client = app.test_client()
+    for path in ("/heatmap.svg", "/heatmap.png", "/heatmap.svg?days=1825&thresholds=quartile"):
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            r = client.get(path)
+        elapsed = time.perf_counter() - t0
+        print(f"GET {path:<42} {args.requests / elapsed:7.0f} req/s  {r.status_code} "
+              f"{r.mimetype} {len(r.data)} B")
+
+
+def bench_api(args):
+    install_snapshot(fake_snapshot(random.Random(args.seed)))
+    app_upgrade.query_cache.clear()
+    client = app_upgrade.app.test_client()
+    print("JSON encoder:", "orjson" if app_upgrade.orjson is not None else "json")
+
+    paths = ["/api/stats", "/api/stats?fields=current,longest", "/api/commits?fields=today",
+             "/api/calendar?encoding=days", "/api/calendar?encoding=plain", "/api/calendar",
+             "/api/calendar?from=2020-01-01&to=2020-12-31"]
+    for path in paths:
+        r = client.get(path)
+        gz = client.get(path, headers={"Accept-Encoding": "gzip"})
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            client.get(path, headers={"If-None-Match": r.headers["ETag"]})
+        elapsed = time.perf_counter() - t0
+        print(f"{path:<44} {r.status_code} {len(r.data):>7} B  gzip {len(gz.data):>6} B  "
+              f"304 polls {args.requests / elapsed:6.0f}/s")
+
+    calendar = app_upgrade.refresher.snapshot["stats"]["calendar"]
+    counts = client.get("/api/calendar").json["counts"]
+    decoded, running = [], 0
+    for delta in counts:
+        running += delta
+        decoded.append(running)
+    print("delta decodes to stored counts:", decoded == calendar.counts.tolist())
+
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_flask():
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app_upgrade.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def _serve_asgi():
+    import uvicorn
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app_upgrade.asgi_app, host="127.0.0.1", port=port,
+                                           log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return f"http://127.0.0.1:{port}", stop
+
+
+def _load(base, path, concurrency, total):
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        t0 = time.perf_counter()
+        r = local.session.get(base + path, timeout=60)
+        return time.perf_counter() - t0, r.status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(lat for lat, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    pct = lambda p: latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+    return total / elapsed, pct(0.5), pct(0.99), errors
+
+
+def bench_load(args):
+    server, _ = start_stub(args.latency)
+    app_upgrade.config.CALENDAR_DB = ""          # every refresh goes to the stub
+    app_upgrade.config.COMMITS_BACKEND = "rest"  # the slow N+1 path
+    app_upgrade.refresher.interval = app_upgrade.async_refresher.interval = args.interval
+    print(f"stub latency {args.latency * 1000:.0f} ms, refresh interval {args.interval}s, "
+          f"{args.concurrency} concurrent clients, {args.requests} requests per run")
+
+    for label, serve in (("flask (threaded WSGI)", _serve_flask), ("asgi (uvicorn)", _serve_asgi)):
+        base, stop = serve()
+        for path in args.paths:
+            if args.cold:
+                app_upgrade.refresher.snapshot = app_upgrade.async_refresher.snapshot = None
+                app_upgrade.commit_cache.clear()
+                app_upgrade.page_cache.clear()
+                app_upgrade.query_cache.clear()
+            rps, p50, p99, errors = _load(base, path, args.concurrency, args.requests)
+            print(f"{label:<22} GET {path:<12} {rps:8.0f} req/s  p50 {p50:7.1f} ms  "
+                  f"p99 {p99:7.1f} ms  errors={errors}")
+        blocked = _heatmap_during_first_view(base, f"/u/load-{label.split()[0]}")
+        print(f"{label:<22} GET /heatmap.svg while a first /u/<login> view loads {blocked * 1000:7.1f} ms")
+        stop()
+    server.shutdown()
+
+
+def _heatmap_during_first_view(base, user_path):
+    # a warm heatmap request timed while another request waits on GitHub
+    import requests
+
+    requests.get(base + "/heatmap.svg?days=30", timeout=60)
+    slow = threading.Thread(target=requests.get, args=(base + user_path,), kwargs={"timeout": 60})
+    slow.start()
+    time.sleep(0.05)
+    t0 = time.perf_counter()
+    requests.get(base + "/heatmap.svg?days=30", timeout=60)
+    elapsed = time.perf_counter() - t0
+    slow.join()
+    return elapsed
+
+
+def bench_users(args):
+    server, _ = start_stub(args.latency)
+    app_upgrade.config.COMMITS_BACKEND = "graphql"  # one call per user instead of 1 + repos
+    users = app_upgrade.UserSnapshots(args.users, args.interval, app_upgrade.FetchScheduler(
+        args.workers, args.per_minute, active_window=args.seconds, tick=0.05))
+    app_upgrade.users = users
+    client = app_upgrade.app.test_client()
+    rng = random.Random(args.seed)
+    # a few users get most of the views (Zipf-like)
+    weights = [1 / (i + 1) for i in range(args.users)]
+    print(f"{args.users} users, stub latency {args.latency * 1000:.0f} ms, refresh interval "
+          f"{args.interval}s, cap {args.per_minute} refreshes/min, {args.workers} workers")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_upgrade.config.CALENDAR_DB = os.path.join(tmp, "users.db")
+        app_upgrade.config.STORE_SYNC_INTERVAL = args.sync_interval
+        app_upgrade._store["instance"] = None
+
+        cold, warm, errors = [], [], 0
+        seen = set()
+        deadline = time.monotonic() + args.seconds
+        while time.monotonic() < deadline:
+            i = rng.choices(range(args.users), weights)[0]
+            t0 = time.perf_counter()
+            r = client.get(f"/u/user{i}")
+            (warm if i in seen else cold).append(time.perf_counter() - t0)
+            seen.add(i)
+            errors += r.status_code != 200
+        time.sleep(0.2)
+        users.scheduler.stop()
+
+    pct = lambda xs, p: sorted(xs)[min(int(p * len(xs)), len(xs) - 1)] * 1000 if xs else 0
+    views = len(cold) + len(warm)
+    print(f"views {views}  distinct users {len(seen)}  errors {errors}")
+    print(f"first view  p50 {pct(cold, 0.5):7.1f} ms  p99 {pct(cold, 0.99):7.1f} ms")
+    print(f"later views p50 {pct(warm, 0.5):7.1f} ms  p99 {pct(warm, 0.99):7.1f} ms")
+    print(f"GitHub requests {StubGitHub.requests_served} "
+          f"({StubGitHub.requests_served / args.seconds * 60:.0f}/min); a per-view rebuild would "
+          f"have made ~{views * 2}")
+    print("users:", users.info())
+    server.shutdown()
+
+
+def bench_team(args):
+    server, _ = start_stub(args.latency, args.max_windows)
+    logins = [f"member{i}" for i in range(args.members)] + ["ghost1"]
+    windows = len(app_upgrade.year_windows())
+    print(f"{args.members} members (+1 unknown), {windows} year windows each, "
+          f"stub latency {args.latency * 1000:.0f} ms, {app_upgrade.config.TEAM_BATCH_WINDOWS} windows per query")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_upgrade.config.CALENDAR_DB = os.path.join(tmp, "team.db")
+        app_upgrade._store["instance"] = None
+        app_upgrade.config.STORE_SYNC_INTERVAL = 0
+
+        for label in ("first refresh (empty store)", "next refresh (deltas)", "cached member rows"):
+            if label != "cached member rows":
+                app_upgrade.team_cache.clear()
+            StubGitHub.requests_served = 0
+            t0 = time.perf_counter()
+            snapshot = app_upgrade.build_team_snapshot(logins)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<28} {elapsed * 1000:8.1f} ms  requests={StubGitHub.requests_served:<4} "
+                  f"members={len(snapshot['team'])} missing={snapshot['missing']}")
+        print(f"one process per member would make {args.members} batched or "
+              f"{args.members * windows} per-year requests")
+
+        members = {login: app_upgrade.load_contributions(login=login) for login in logins[:-1]}
+    today = members[logins[0]][1].end
+    rows, bulk, _ = measure(lambda: app_upgrade.team_leaderboard(members, today), repeat=5)
+
+    def one_by_one():
+        out = []
+        for login, (total, calendar) in members.items():
+            a = app_upgrade.streak_analytics(calendar, today)
+            out.append((login, a["current"], a["longest"]))
+        return out
+    each, per_member, _ = measure(one_by_one, repeat=5)
+    same = [(r["login"], r["current"], r["longest"]) for r in rows] == each
+    print(f"leaderboard rows: bulk {bulk * 1000:7.1f} ms   per-member streak_analytics "
+          f"{per_member * 1000:7.1f} ms   identical={same}")
+    server.shutdown()
+
+
+class BlindBudget(app_upgrade.RateBudget):
+    # what the fetchers did before: never look at the budget before calling
+    def allows(self, *args, **kwargs):
+        return True
+
+    def acquire(self, *args, **kwargs):
+        pass
+
+
+def bench_ratelimit(args):
+    server, _ = start_stub(args.latency)
+    app_upgrade.config.COMMITS_BACKEND = "rest"
+    app_upgrade.config.STORE_SYNC_INTERVAL = 0
+    print(f"stub limits per {args.window:.0f}s window: core {args.core}, graphql {args.graphql}; "
+          f"{args.rounds} dashboard refreshes (delta sync + REST commit scan)")
+
+    for label, budget in (("no budget accounting", BlindBudget()), ("RateBudget", app_upgrade.RateBudget())):
+        StubGitHub.rate_limits = {"core": args.core, "graphql": args.graphql}
+        StubGitHub.rate_window, StubGitHub.rate_reset = args.window, 0.0
+        StubGitHub.requests_served = StubGitHub.throttled = 0
+        app_upgrade.rate_budget = budget
+        app_upgrade.token_pool = app_upgrade.TokenPool([app_upgrade.config.TOKEN], budget)
+        app_upgrade.http_cache.entries.clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            app_upgrade.config.CALENDAR_DB = os.path.join(tmp, "rate.db")
+            app_upgrade._store["instance"] = None
+            refresher = app_upgrade.SnapshotRefresher(app_upgrade.build_snapshot, 0, background=False)
+            failed = empty_commits = 0
+            for _ in range(args.rounds):
+                app_upgrade.commit_cache.delete(("recent_commits", "rest"))  # COMMIT_CACHE_TTL passed
+                try:
+                    ok = refresher.refresh()
+                except Exception:
+                    ok = False
+                failed += not ok
+                commits = refresher.snapshot["commits"] if refresher.snapshot else None
+                empty_commits += not commits or not (commits["today"] or commits["yesterday"])
+        print(f"{label:<22} requests={StubGitHub.requests_served:<5} 403s={StubGitHub.throttled:<5} "
+              f"failed refreshes={failed:<3} pages without commits={empty_commits:<3} "
+              f"deferred={budget.stats['deferred']}")
+    print("budget:", app_upgrade.rate_budget.info())
+    server.shutdown()
+
+
+def bench_tokens(args):
+    server, _ = start_stub(args.latency)
+    StubGitHub.rate_limits = {"graphql": args.graphql}
+    logins = [f"viewer{i}" for i in range(args.users)]
+    print(f"{args.users} other users' batched refreshes, stub graphql limit {args.graphql} "
+          f"per {args.window:.0f}s window per token")
+
+    pools = [(f"{n} token(s)", [app_upgrade.config.TOKEN] + [f"extra-{i}" for i in range(n - 1)]) for n in args.tokens]
+    pools.append((f"{args.tokens[-1]} + 1 revoked", pools[-1][1] + ["bad-revoked"]))
+    for label, tokens in pools:
+        StubGitHub.rate_window, StubGitHub.rate_reset = args.window, 0.0
+        StubGitHub.requests_served = StubGitHub.throttled = 0
+        budget = app_upgrade.RateBudget()
+        app_upgrade.rate_budget = budget
+        pool = app_upgrade.token_pool = app_upgrade.TokenPool(tokens, budget)
+        done = limited = rejected = 0
+        t0 = time.perf_counter()
+        for login in logins:
+            try:
+                app_upgrade.fetch_contributions_remote(login=login)
+                done += 1
+            except app_upgrade.RateLimited:
+                limited += 1
+            except app_upgrade.BadToken:
+                rejected += 1
+        elapsed = time.perf_counter() - t0
+        quarantined = sum(1 for t in pool.info().values() if t["quarantined_for"])
+        print(f"{label:<20} refreshed={done:<4} rate-limited={limited:<4} 401s={rejected:<2} "
+              f"403s={StubGitHub.throttled:<3} quarantined={quarantined}  {elapsed * 1000:7.1f} ms")
+    print("picks:", {tid: t["picks"] for tid, t in pool.info().items()})
+
+    # a primary token that keeps getting 401s backs off instead of locking the
+    # owner out for TOKEN_QUARANTINE at once
+    now = [0.0]
+    pool = app_upgrade.TokenPool([app_upgrade.config.TOKEN], app_upgrade.RateBudget(), clock=lambda: now[0])
+    waits = []
+    for _ in range(8):
+        pool.quarantine(pool.primary)
+        waits.append(pool.info()[pool.primary]["quarantined_for"])
+    print(f"primary token quarantine after 1..8 401s in a row: {waits} s "
+          f"(TOKEN_QUARANTINE {app_upgrade.config.TOKEN_QUARANTINE:.0f} s)")
+    server.shutdown()
+
+
+def _primed_refresher(retries, breaker_failures):
+    # fresh retry budget and breakers, and a refresher holding one good snapshot
+    app_upgrade.config.FETCH_RETRIES = retries
+    app_upgrade.retry_budget = app_upgrade.RetryBudget()
+    app_upgrade.breakers = {name: app_upgrade.CircuitBreaker(name, failures=breaker_failures)
+                            for name in app_upgrade.breakers}
+    refresher = app_upgrade.SnapshotRefresher(app_upgrade.build_snapshot, 0, background=False)
+    StubGitHub.fail_rate = 0.0
+    refresher.refresh()
+    return refresher
+
+
+def bench_flaky(args):
+    server, _ = start_stub(args.latency)
+    app_upgrade.config.COMMITS_BACKEND = "rest"
+    app_upgrade.config.STORE_SYNC_INTERVAL = 0
+    app_upgrade.config.RETRY_BASE_DELAY = args.base_delay
+    StubGitHub.repos = args.repos
+    pct = lambda xs, p: sorted(xs)[min(int(p * len(xs)), len(xs) - 1)] * 1000 if xs else 0
+    never = 10 ** 9
+
+    def run(label, fail_rate, retries, breaker_failures):
+        with tempfile.TemporaryDirectory() as tmp:
+            app_upgrade.config.CALENDAR_DB = os.path.join(tmp, "flaky.db")
+            app_upgrade._store["instance"] = None
+            app_upgrade.commit_cache.clear()
+            refresher = _primed_refresher(retries, breaker_failures)
+            StubGitHub.fail_rate, StubGitHub.failed, StubGitHub.requests_served = fail_rate, 0, 0
+            failed, times, stale, down = 0, [], 0, 0
+            for _ in range(args.rounds):
+                app_upgrade.commit_cache.delete(("recent_commits", "rest"))  # COMMIT_CACHE_TTL passed
+                fallbacks = sum(app_upgrade.fallback_stats().values())
+                t0 = time.perf_counter()
+                try:
+                    ok = refresher.refresh()
+                except Exception:
+                    ok = False
+                times.append(time.perf_counter() - t0)
+                failed += not ok
+                # the stub's data never changes, so compare outcomes, not digests: the
+                # page kept the last snapshot, or a fetcher fell back to stored rows
+                fell_back = sum(app_upgrade.fallback_stats().values()) > fallbacks
+                stale += refresher.snapshot is not None and (not ok or fell_back)
+                down += refresher.snapshot is None
+            StubGitHub.fail_rate = 0.0
+        print(f"{label:<30} failed refreshes={failed:<3} refresh p50 {pct(times, 0.5):7.1f} ms  "
+              f"p99 {pct(times, 0.99):7.1f} ms  requests={StubGitHub.requests_served:<5} "
+              f"5xx={StubGitHub.failed:<5} pages on last good data={stale:<3} pages down={down}")
+
+    print(f"{args.rounds} dashboard refreshes (delta sync + REST scan of {args.repos} repos), "
+          f"{args.fail_rate:.0%} of requests failing, latency {args.latency * 1000:.0f} ms")
+    run("no retries", args.fail_rate, 0, never)
+    run("jittered retries", args.fail_rate, 2, never)
+    run("jittered retries + breakers", args.fail_rate, 2, app_upgrade.config.CIRCUIT_FAILURES)
+
+    StubGitHub.latency = args.outage_latency
+    print(f"outage: every request fails after {args.outage_latency * 1000:.0f} ms")
+    run("jittered retries", 1.0, 2, never)
+    run("jittered retries + breakers", 1.0, 2, app_upgrade.config.CIRCUIT_FAILURES)
+    print("retries:", app_upgrade.retry_budget.info())
+    print("circuits:", {name: b.info() for name, b in app_upgrade.breakers.items()})
+
+    # a gateway outage: batched queries read a 502 as "ask for less", so only
+    # the per-window queries they split down to may count against the circuit
+    StubGitHub.latency, StubGitHub.fail_status = args.latency, 502
+    _primed_refresher(2, app_upgrade.config.CIRCUIT_FAILURES)
+    StubGitHub.fail_rate, sent = 1.0, []
+    for _ in range(args.gateway_fetches):
+        StubGitHub.requests_served = 0
+        try:
+            app_upgrade.fetch_contributions_remote(mode="batched")
+        except app_upgrade.GitHubError:
+            pass
+        sent.append(StubGitHub.requests_served)
+    StubGitHub.fail_rate, StubGitHub.fail_status = 0.0, 503
+    graphql = app_upgrade.breakers["graphql"].info()
+    print(f"outage: every request gets a 502, {args.gateway_fetches} batched calendar fetches")
+    print(f"requests per fetch {sent}  graphql circuit {graphql['state']} (opened {graphql['opened']}x)")
+    server.shutdown()
+    if graphql["opened"] == 0:
+        print("MISMATCH: the graphql circuit never opened")
+        raise SystemExit(1)
+
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+# run in a fresh interpreter without credentials: import the module, then
+# use the stats engine and build the Flask app, noting what each pulls in
+_STARTUP_PROBE = """
+import json, sys, time
+from datetime import date, timedelta
+t0 = time.perf_counter()
+import app_upgrade
+t1 = time.perf_counter()
+heavy = ("flask", "requests", "numpy", "jinja2", "dotenv", "asyncio", "concurrent.futures")
+loaded = lambda: [m for m in heavy if m in sys.modules]
+out = {"import": t1 - t0, "after_import": loaded()}
+start = date(2008, 1, 1)
+days = [{"date": (start + timedelta(days=i)).isoformat(), "contributionCount": i % 7 % 3}
+        for i in range((date.today() - start).days + 1)]
+t0 = time.perf_counter()
+app_upgrade.calculate_stats(days)
+out["stats"], out["after_stats"] = time.perf_counter() - t0, loaded()
+t0 = time.perf_counter()
+app_upgrade.create_app()
+out["app"], out["after_app"] = time.perf_counter() - t0, loaded()
+print(json.dumps(out))
+"""
+
+
+def _clean_env():
+    # no credentials, and .pyc files written so runs measure imports, not compiles
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("GITHUB_USERNAME", "GITHUB_TOKEN", "GITHUB_TOKENS", "PYTHONDONTWRITEBYTECODE")}
+    env["PYTHONPATH"] = os.path.dirname(os.path.abspath(app_upgrade.__file__))
+    return env
+
+
+def importtime(code, env):
+    # -> [(module, self us, cumulative us, depth)] from `python -X importtime`,
+    # in the order imports finished (a module's imports come right before it)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                          capture_output=True, text=True, check=True)
+    return [(m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2)
+            for m in map(_IMPORTTIME_RE.match, proc.stderr.splitlines()) if m]
+
+
+def direct_imports(rows, name):
+    # [(module, cumulative us)] imported directly by `name`, heaviest first
+    end = next(i for i, row in enumerate(rows) if row[0] == name and row[3] == 0)
+    start = next((i + 1 for i in range(end - 1, -1, -1) if rows[i][3] == 0), 0)
+    return sorted(((row[0], row[2]) for row in rows[start:end] if row[3] == 1),
+                  key=lambda row: -row[1])
+
+
+def bench_startup(args):
+    env = _clean_env()
+    importtime("import app_upgrade", env)  # warm up the bytecode cache
+    runs = [{row[0]: row for row in importtime("import app_upgrade", env) if row[3] == 0}
+            for _ in range(args.runs)]
+    total = statistics.median(r["app_upgrade"][2] for r in runs) / 1000
+    own = statistics.median(r["app_upgrade"][1] for r in runs) / 1000
+    print(f"import app_upgrade: {total:.1f} ms median of {args.runs} (module body {own:.1f} ms), "
+          "no credentials set")
+    print("heaviest imports pulled in:")
+    for name, cum in direct_imports(importtime("import app_upgrade", env), "app_upgrade")[:args.top]:
+        print(f"  {name:<20} {cum / 1000:6.1f} ms")
+
+    # what the old eager imports cost, now paid on first use instead
+    heavy = ("flask", "requests", "numpy", "asyncio", "jinja2", "dotenv", "concurrent.futures")
+    print("deferred until first use:")
+    for name in heavy:
+        rows = importtime(f"import {name}", env)
+        print(f"  {name:<20} {next(row[2] for row in rows if row[0] == name) / 1000:6.1f} ms")
+
+    out = json.loads(subprocess.run([sys.executable, "-c", _STARTUP_PROBE], env=env,
+                                    capture_output=True, text=True, check=True).stdout)
+    print(f"probe: import {out['import'] * 1000:.1f} ms, loaded {out['after_import'] or 'nothing heavy'}")
+    print(f"  first calculate_stats() {out['stats'] * 1000:6.1f} ms, loaded {out['after_stats']}")
+    print(f"  create_app()            {out['app'] * 1000:6.1f} ms, loaded {out['after_app']}")
+
+
+def rss_kib():
+    # resident set size now; ru_maxrss only has the high-water mark
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+STREAM_MODES = {
+    "whole": "r.json() + day dicts (before)",
+    "scanner": "streamed, json_events()",
+    "ijson": "streamed, ijson",
+}
+
+
+def merge_day_dicts(calendars):
+    # the year calendars as one list of GitHub-style day dicts, as before
+    total, days = 0, []
+    for cal in calendars:
+        total += cal["totalContributions"]
+        days.extend({"date": d.isoformat(), "contributionCount": c} for d, c in cal["calendar"].items())
+    return total, days
+
+
+def _stream_child(args):
+    # one workload in this (fresh) process; prints peak RSS growth as JSON
+    app_upgrade.API_URL = args.url
+    app_upgrade.GRAPHQL_URL = args.url + "/graphql"
+    app_upgrade.config.CALENDAR_DB = ""
+    if args.child == "whole":
+        # how calendars were read before: whole body, full tree, a dict per day
+        app_upgrade.read_calendar_json = app_upgrade.response_json
+        app_upgrade._join_calendars = merge_day_dicts
+    elif args.child == "scanner":
+        app_upgrade.ijson = None
+
+    if args.workload == "team":
+        logins = [f"member{i}" for i in range(args.members)]
+        run = lambda: app_upgrade.fetch_team_contributions(logins, args.workers)
+    else:
+        run = lambda: {"self": app_upgrade.fetch_contributions_remote(mode="batched")}
+    app_upgrade._fetch_window(*app_upgrade.year_windows()[-1], login="warmup")  # imports, session
+
+    gc.collect()
+    before = rss_kib()
+    t0 = time.perf_counter()
+    members = run()
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    today = datetime.now().date()
+    rows = app_upgrade.team_leaderboard(members, today)
+    digest = hashlib.sha256(repr(rows).encode()).hexdigest()[:12]
+    print(json.dumps({"growth_kib": peak - before, "seconds": elapsed, "digest": digest}))
+
+
+def bench_stream(args):
+    if args.child:
+        return _stream_child(args)
+    server, base = start_stub(args.latency)
+    modes = [m for m in STREAM_MODES if m != "ijson" or importlib.util.find_spec("ijson")]
+    print(f"peak RSS growth while fetching (fresh process per run), "
+          f"{args.members} team members x {len(app_upgrade.year_windows())} years, {args.workers} workers")
+    for workload in ("history", "team"):
+        digests = set()
+        for mode in modes:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "stream", "--child", mode,
+                                  "--url", base, "--workload", workload,
+                                  "--members", str(args.members), "--workers", str(args.workers)],
+                                 capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.splitlines()[-1])
+            digests.add(result["digest"])
+            print(f"{workload:<8} {STREAM_MODES[mode]:<30} peak RSS +{result['growth_kib'] / 1024:7.1f} MiB  "
+                  f"{result['seconds'] * 1000:8.1f} ms")
+        print(f"{workload:<8} results identical: {len(digests) == 1}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("fetch", help="serial vs concurrent vs batched fetch_contributions()")
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 18])
+    p.add_argument("--max-windows", type=int, default=0,
+                   help="make the stub reject aliased queries with more windows than this")
+    p.set_defaults(func=bench_fetch)
+
+    p = sub.add_parser("store", help="calendar store: full sync, delta sync, cold load")
+    p.add_argument("--latency", type=float, default=0.2)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("commits", help="serial vs fan-out vs graphql fetch_recent_commits()")
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--repos", type=int, default=50)
+    p.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    p.set_defaults(func=bench_commits)
+
+    p = sub.add_parser("http", help="fresh connections vs the shared keep-alive session")
+    p.add_argument("--calls", type=int, default=200)
+    p.set_defaults(func=bench_http)
+
+    p = sub.add_parser("conditional", help="REST commit scan with a cold vs warm ETag cache")
+    p.add_argument("--latency", type=float, default=0.02)
+    p.set_defaults(func=bench_conditional)
+
+    p = sub.add_parser("streaks", help="streak engine vs the original calculate_stats()")
+    p.add_argument("--cases", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--no-numpy", action="store_true", help="force the pure-Python fallback")
+    p.set_defaults(func=bench_streaks)
+
+    p = sub.add_parser("calendar", help="dict calendar vs ContributionCalendar: memory and speed")
+    p.add_argument("--years", type=int, default=18)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_calendar)
+
+    p = sub.add_parser("render", help="render_template_string per request vs precompiled template")
+    p.add_argument("--requests", type=int, default=300)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("page", help="dashboard page cache: re-render vs cached vs 304")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_page)
+
+    p = sub.add_parser("heatmap", help="per-day heatmap loop vs heatmap_levels()")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_heatmap)
+
+    p = sub.add_parser("heatmap-image", help="div grid vs /heatmap.svg and /heatmap.png")
+    p.add_argument("--requests", type=int, default=300)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_heatmap_image)
+
+    p = sub.add_parser("api", help="JSON API payload sizes and 304 polling rate")
+    p.add_argument("--requests", type=int, default=300)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_api)
+
+    p = sub.add_parser("load", help="concurrent load: Flask WSGI vs ASGI mode (needs uvicorn, httpx)")
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--interval", type=float, default=1.0)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--paths", nargs="+", default=["/", "/api/stats"])
+    p.add_argument("--cold", action="store_true", help="drop snapshots and caches before each run")
+    p.set_defaults(func=bench_load)
+
+    p = sub.add_parser("users", help="/u/<login> views across many users with the shared scheduler")
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--interval", type=float, default=2.0, help="per-user refresh interval")
+    p.add_argument("--per-minute", type=int, default=600, help="scheduler refresh cap")
+    p.add_argument("--sync-interval", type=int, default=0,
+                   help="STORE_SYNC_INTERVAL; 0 = every refresh syncs the calendar")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_users)
+
+    p = sub.add_parser("team", help="team leaderboard: aliased multi-user queries and bulk streaks")
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--members", type=int, default=200)
+    p.add_argument("--max-windows", type=int, default=0,
+                   help="make the stub reject aliased queries with more windows than this")
+    p.set_defaults(func=bench_team)
+
+    p = sub.add_parser("ratelimit", help="refreshes against a rate-limited stub, with and without RateBudget")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--core", type=int, default=200)
+    p.add_argument("--graphql", type=int, default=40)
+    p.add_argument("--window", type=float, default=60.0)
+    p.add_argument("--rounds", type=int, default=30)
+    p.set_defaults(func=bench_ratelimit)
+
+    p = sub.add_parser("tokens", help="other users' refreshes per window with 1..N pooled tokens")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--users", type=int, default=300)
+    p.add_argument("--graphql", type=int, default=50)
+    p.add_argument("--window", type=float, default=600.0)
+    p.add_argument("--tokens", type=int, nargs="+", default=[1, 2, 4])
+    p.set_defaults(func=bench_tokens)
+
+    p = sub.add_parser("flaky", help="refreshes against a failing stub: retries, retry budget, breakers")
+    p.add_argument("--latency", type=float, default=0.005)
+    p.add_argument("--repos", type=int, default=20)
+    p.add_argument("--fail-rate", type=float, default=0.2)
+    p.add_argument("--rounds", type=int, default=40)
+    p.add_argument("--outage-latency", type=float, default=0.3)
+    p.add_argument("--base-delay", type=float, default=0.05)
+    p.add_argument("--gateway-fetches", type=int, default=6)
+    p.set_defaults(func=bench_flaky)
+
+    p = sub.add_parser("startup", help="-X importtime cost of importing app_upgrade without credentials")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=8)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("stream", help="peak RSS of streamed vs whole-body calendar decoding")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--members", type=int, default=200)
+    p.add_argument("--workers", type=int, default=6)
+    p.add_argument("--child", choices=sorted(STREAM_MODES), help=argparse.SUPPRESS)
+    p.add_argument("--url", help=argparse.SUPPRESS)
+    p.add_argument("--workload", choices=("history", "team"), help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_stream)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Streak tests for app_upgrade.py: StreakEngine and streak_analytics() against
+the pre-engine calculate_stats() on random calendars.
+
+Run with: python -m pytest
+The helpers here also feed bench_app_upgrade.py's streaks and calendar benches.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import app_upgrade
+
+
+# ---------------- REFERENCE STATS ---------------- #
+
+def reference_stats(days, today):
+    # calculate_stats() as it was before the streak engine, with today passed in
+    calendar = {datetime.strptime(d["date"], "%Y-%m-%d").date(): d["contributionCount"] for d in days}
+    active_days = [d for d, c in calendar.items() if c > 0]
+
+    total_start, total_end = min(active_days), max(active_days)
+
+    longest = temp = 0
+    ls_start = ls_end = None
+    cur_start = None
+
+    for d in sorted(calendar):
+        if calendar[d] > 0:
+            temp += 1
+            if temp == 1:
+                cur_start = d
+            if temp > longest:
+                longest, ls_start, ls_end = temp, cur_start, d
+        else:
+            temp = 0
+
+    if calendar.get(today, 0) > 0:
+        cs_end = today
+    elif calendar.get(today - timedelta(days=1), 0) > 0:
+        cs_end = today - timedelta(days=1)
+    else:
+        return {"total_range": (total_start, total_end), "current": 0,
+                "current_range": (None, None), "longest": longest,
+                "longest_range": (ls_start, ls_end), "calendar": calendar}
+
+    current = 0
+    d = cs_end
+    cs_start = None
+
+    while calendar.get(d, 0) > 0:
+        cs_start = d
+        current += 1
+        d -= timedelta(days=1)
+
+    return {
+        "total_range": (total_start, total_end),
+        "current": current,
+        "current_range": (cs_start, cs_end),
+        "longest": longest,
+        "longest_range": (ls_start, ls_end),
+        "calendar": calendar
+    }
+
+
+def random_days(rng, n, gaps=False):
+    # contiguous calendar (as GitHub returns it) with streaky activity; with
+    # gaps, some dates are missing (the engine reads them as zero days)
+    start = date(2008, 1, 1) + timedelta(days=rng.randrange(5000))
+    p_active = rng.random()
+    days, active = [], rng.random() < p_active
+    for i in range(n):
+        if rng.random() < 0.3:
+            active = rng.random() < p_active
+        count = rng.randint(1, 40) if active else 0
+        days.append({"date": (start + timedelta(days=i)).isoformat(), "contributionCount": count})
+    if gaps and n > 2:
+        keep = rng.uniform(0.3, 0.95)
+        days = [days[0]] + [d for d in days[1:-1] if rng.random() < keep] + [days[-1]]
+    if n and not any(d["contributionCount"] for d in days):
+        days[rng.randrange(len(days))]["contributionCount"] = 1
+    return days
+
+
+def random_today(rng, days):
+    if not days:
+        return date(2008, 1, 1) + timedelta(days=rng.randrange(7000))
+    last = date.fromisoformat(days[-1]["date"])
+    return last - timedelta(days=rng.choice([0, 0, 0, 1, 1, 2, -1, -2, rng.randrange(len(days))]))
+
+
+def zero_filled(days):
+    # the same calendar with every missing date present as a zero day
+    if not days:
+        return []
+    start = date.fromisoformat(days[0]["date"])
+    counts = {d["date"]: d["contributionCount"] for d in days}
+    n = (date.fromisoformat(days[-1]["date"]) - start).days + 1
+    return [{"date": day, "contributionCount": counts.get(day, 0)}
+            for day in ((start + timedelta(days=i)).isoformat() for i in range(n))]
+
+
+def expected_stats(days, today):
+    # reference_stats() for any input the engine takes: gaps, no active days, empty
+    days = zero_filled(days)
+    if not any(d["contributionCount"] for d in days):
+        return {"total_range": (None, None), "current": 0, "current_range": (None, None),
+                "longest": 0, "longest_range": (None, None),
+                "calendar": {date.fromisoformat(d["date"]): 0 for d in days}}
+    return reference_stats(days, today)
+
+
+def engine_stats(days, today):
+    engine = app_upgrade.StreakEngine()
+    engine.update(days)
+    return engine.stats(today)
+
+
+def check_stats(label, got, want):
+    got = dict(got, calendar=dict(got["calendar"].items()))
+    if got != want:
+        print(f"MISMATCH ({label})")
+        for k in want:
+            if got[k] != want[k] and k != "calendar":
+                print(f"  {k}: got {got[k]!r} want {want[k]!r}")
+        return False
+    return True
+
+
+def check_analytics(label, calendar, want, today):
+    got = app_upgrade.streak_analytics(calendar, today)
+    lo, cur = got["longest"], got["current"]
+    if (lo["length"], (lo["start"], lo["end"])) != (want["longest"], want["longest_range"]) or \
+            (cur["length"], (cur["start"], cur["end"])) != (want["current"], want["current_range"]):
+        print(f"MISMATCH ({label}, streak_analytics): {lo} {cur}")
+        return False
+    return True
+
+
+def check_streak_properties(rng, cases):
+    """StreakEngine and streak_analytics() against reference_stats() on
+    random calendars: contiguous, with missing dates, and empty; fed whole,
+    as a ContributionCalendar and incrementally. True if all agree."""
+    engine = app_upgrade.StreakEngine()
+    ok = True
+
+    for case in range(cases):
+        kind = rng.random()
+        if kind < 0.05:
+            days = []
+        else:
+            days = random_days(rng, rng.randint(1, 800), gaps=kind < 0.35)
+        today = random_today(rng, days)
+        want = expected_stats(days, today)
+        ok &= check_stats(f"case {case}, full", engine_stats(days, today), want)
+
+        calendar = app_upgrade.ContributionCalendar.from_days(days)
+        engine.update(calendar)
+        ok &= check_stats(f"case {case}, from calendar", engine.stats(today), want)
+        ok &= check_analytics(f"case {case}", calendar, want, today)
+        engine.reset()
+
+        if not days:
+            continue
+
+        # incremental: feed a prefix, then the rest (sometimes with the last
+        # prefix day edited, sometimes with an older day edited), as days
+        # or with the gaps zero-filled
+        cut = rng.randint(1, len(days))
+        as_calendar = rng.random() < 0.3
+        prefix = [dict(d) for d in days[:cut]]
+        engine.update(app_upgrade.ContributionCalendar.from_days(prefix) if as_calendar else prefix)
+        edit = rng.random()
+        if edit < 0.3:
+            days[cut - 1]["contributionCount"] = rng.randint(0, 5)
+        elif edit < 0.4:
+            days[rng.randrange(cut)]["contributionCount"] = rng.randint(0, 5)
+        if not any(d["contributionCount"] for d in days):
+            days[-1]["contributionCount"] = 1
+        if as_calendar:
+            engine.update(app_upgrade.ContributionCalendar.from_days(days))
+        else:
+            engine.update(zero_filled(days) if rng.random() < 0.5 else days)
+        ok &= check_stats(f"case {case}, incremental", engine.stats(today), expected_stats(days, today))
+
+        # day by day, checking at the cut as well
+        engine.reset()
+        for i, d in enumerate(days):
+            if i == cut:
+                ok &= check_stats(f"case {case}, appended prefix", engine.stats(today),
+                                  expected_stats(days[:cut], today))
+            engine.append(date.fromisoformat(d["date"]), d["contributionCount"])
+        ok &= check_stats(f"case {case}, appended", engine.stats(today), expected_stats(days, today))
+        engine.reset()
+    return ok
+
+
+def test_streak_engine():
+    assert check_streak_properties(random.Random(1), 300)
+
+
+def test_streak_engine_without_numpy(monkeypatch):
+    monkeypatch.setattr(app_upgrade, "np", None)
+    assert check_streak_properties(random.Random(2), 300)